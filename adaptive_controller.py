@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+目標FPSを維持するためのモデル・解像度の自動切り替え
+フレームごとの処理時間を計測し、処理が追いつかなければ軽いモデル・低い解像度へ、
+余裕があれば重いモデル・高い解像度へ切り替えます
+"""
+
+import os
+import time
+
+
+# 軽い順に並べたモデルと推論解像度の組み合わせ
+MODEL_LADDER = [
+    ("yolo11n-pose.pt", 480),
+    ("yolo11n-pose.pt", 640),
+    ("yolo11s-pose.pt", 640),
+    ("yolo11m-pose.pt", 640),
+]
+
+# 指定されたモデルがMODEL_LADDERにない場合の開始位置
+DEFAULT_LEVEL = 2
+
+# 重くするまでに待つフレーム数の上限
+MAX_UPGRADE_PATIENCE = 1800
+
+
+class AdaptiveModelController:
+    """フレーム処理時間に応じてモデルと推論解像度を切り替える
+
+    処理時間は指数移動平均で平滑化し、予算（1 / target_fps）を超える状態が
+    patienceフレーム続いたら1段階軽く、予算のheadroom倍を下回る状態が続いたら
+    1段階重くする。開始直後と切り替え直後のcooldownフレームは処理時間を記録せず、
+    その後の最初のフレームから平滑化をやり直す。
+    重くした直後に軽く戻した場合は、次に重くするまでの待ちを倍にして往復を抑える。
+
+    initial_modelとファイル名が一致する候補には、そのパスと読み込み済みのmodelを使う。
+    """
+
+    def __init__(self, target_fps, model_loader, initial_model=None, model=None,
+                 ladder=MODEL_LADDER, patience=15, cooldown=30, headroom=0.7,
+                 smoothing=0.1, log=print):
+        self.budget = 1.0 / target_fps
+        self.patience = patience
+        self.cooldown = cooldown
+        self.headroom = headroom
+        self.smoothing = smoothing
+        self.log = log
+        self.switches = []
+
+        names = [os.path.basename(name) for name, _ in ladder]
+        initial_name = os.path.basename(initial_model) if initial_model else None
+        # 同じモデルの候補が複数ある場合は、通常の推論解像度に近い最も高い解像度から開始する
+        self.level = max((i for i, name in enumerate(names) if name == initial_name),
+                         key=lambda i: ladder[i][1], default=DEFAULT_LEVEL)
+        if initial_name is not None and initial_name not in names:
+            log(f"警告: {initial_model} は切り替え候補にないため {ladder[self.level][0]} から開始します")
+
+        # 指定されたモデルのファイルを、同じ名前の候補の代わりに使う
+        self.ladder = [(initial_model if os.path.basename(path) == initial_name else path, imgsz)
+                       for path, imgsz in ladder]
+
+        # 切り替え時に処理が止まらないよう、候補のモデルはすべて先に読み込む
+        self._models = {}
+        if model is not None and initial_name in names:
+            self._models[initial_model] = model
+        for path, _ in self.ladder:
+            if path not in self._models:
+                self._models[path] = model_loader(path)
+        self._warm_up()
+
+        self._upgrade_patience = patience
+        self._frame = 0
+        self._last_tick = None
+        self._latency = None
+        self._over = 0
+        self._under = 0
+        self._cooldown_left = cooldown
+        self._last_switch_up = None
+
+    @property
+    def model_name(self):
+        return self.ladder[self.level][0]
+
+    @property
+    def imgsz(self):
+        return self.ladder[self.level][1]
+
+    @property
+    def fps(self):
+        """平滑化した処理時間から求めたFPS"""
+        return 1.0 / self._latency if self._latency else 0.0
+
+    def _warm_up(self):
+        """候補ごとに1度推論し、切り替え後の最初のフレームが初回推論の遅さを含まないようにする"""
+        import numpy as np
+
+        for path, imgsz in dict.fromkeys(self.ladder):
+            dummy = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+            self._models[path](dummy, imgsz=imgsz, save=False, verbose=False)
+
+    def infer(self, frame):
+        """現在のモデル・解像度で姿勢推定を実行"""
+        model = self._models[self.model_name]
+        return model(frame, imgsz=self.imgsz, save=False, verbose=False)[0]
+
+    def tick(self):
+        """各フレームの処理開始時に呼び出し、直前のフレームの処理時間を記録"""
+        now = time.perf_counter()
+        if self._last_tick is not None:
+            self._record(now - self._last_tick)
+        self._last_tick = now
+        self._frame += 1
+
+    def _record(self, latency):
+        # cooldown中のフレーム（モデル切り替え直後の遅いフレームを含む）は平均に入れない
+        if self._cooldown_left > 0:
+            self._cooldown_left -= 1
+            return
+
+        if self._latency is None:
+            self._latency = latency
+        else:
+            self._latency += self.smoothing * (latency - self._latency)
+
+        self._over = self._over + 1 if self._latency > self.budget else 0
+        self._under = self._under + 1 if self._latency < self.budget * self.headroom else 0
+
+        if self._over >= self.patience and self.level > 0:
+            # 重くした直後に戻す場合は、次に重くするまでの待ちを延ばす
+            if self._last_switch_up is not None and \
+                    self._frame - self._last_switch_up <= self.cooldown + 4 * self.patience:
+                self._upgrade_patience = min(self._upgrade_patience * 2, MAX_UPGRADE_PATIENCE)
+            self._last_switch_up = None
+            self._switch(self.level - 1)
+        elif self._under >= self._upgrade_patience and self.level < len(self.ladder) - 1:
+            self._last_switch_up = self._frame
+            self._switch(self.level + 1)
+
+    def _switch(self, level):
+        old_name, old_imgsz = self.ladder[self.level]
+        fps = self.fps
+        self.level = level
+        self.switches.append((self._frame, old_name, old_imgsz, self.model_name, self.imgsz, fps))
+        self.log(f"モデル切り替え (フレーム {self._frame}): {old_name}@{old_imgsz} -> "
+                 f"{self.model_name}@{self.imgsz} (切り替え前 {fps:.1f} fps, "
+                 f"目標 {1.0 / self.budget:.1f} fps)")
+
+        # 新しい設定の処理時間を測り直す
+        self._latency = None
+        self._over = 0
+        self._under = 0
+        self._cooldown_left = self.cooldown
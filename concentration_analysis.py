@@ -10,13 +10,16 @@ df = pd.read_csv("pose_output_selected.csv")
 df = df.dropna(subset=["tracking_id"])
 df["tracking_id"] = df["tracking_id"].astype(int)
 
-# Filter out invalid coordinates (assuming (0,0) is invalid for nose)
-# Check how many such rows exist
-invalid_nose_count = df[(df["nose_x"] == 0) & (df["nose_y"] == 0)].shape[0]
-print(f"Rows with nose at (0,0): {invalid_nose_count}")
-
-# Remove rows where nose_y is 0 or NaN (as this affects the look_down calculation significantly)
-df = df[(df["nose_y"].notna()) & (df["nose_y"] != 0)]
+# Filter out rows where the nose has never been observed
+# (nose_age is empty until the first observation; older CSVs without it use (0,0) as the marker)
+if "nose_age" in df.columns:
+    valid_nose = df["nose_age"].notna()
+else:
+    valid_nose = df["nose_y"].notna() & (df["nose_y"] != 0)
+print(f"Rows without an observed nose: {(~valid_nose).sum()}")
+
+# Remove these rows (as they affect the look_down calculation significantly)
+df = df[valid_nose]
 
 # Fix look_down column type
 # Inspect unique values again to be sure
@@ -9,8 +9,11 @@ df = pd.read_csv("pose_output_selected.csv")
 df = df.dropna(subset=["tracking_id"])
 df["tracking_id"] = df["tracking_id"].astype(int)
 
-# Remove rows where nose_y is 0 or NaN
-df = df[(df["nose_y"].notna()) & (df["nose_y"] != 0)]
+# Remove rows where the nose has never been observed
+if "nose_age" in df.columns:
+    df = df[df["nose_age"].notna()]
+else:
+    df = df[(df["nose_y"].notna()) & (df["nose_y"] != 0)]
 
 # Convert look_down to boolean
 def to_bool(x):
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+頭部姿勢（うつむき）特徴量の計算
+1フレーム内の全トラッキング対象、または記録済みCSV全体の特徴量を
+配列演算でまとめて計算し、トラックごとのヒステリシスでうつむき状態を平滑化します
+"""
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from look_down_thresholds import LOOK_DOWN_ENTER, LOOK_DOWN_EXIT
+
+
+# COCOキーポイントの定義
+COCO_KEYPOINTS = [
+    "nose",
+    "left-eye",
+    "right-eye",
+    "left-ear",
+    "right-ear",
+    "left-shoulder",
+    "right-shoulder",
+    "left-elbow",
+    "right-elbow",
+    "left-wrist",
+    "right-wrist",
+    "left-hip",
+    "right-hip",
+    "left-knee",
+    "right-knee",
+    "left-ankle",
+    "right-ankle",
+]
+
+NOSE, LEFT_EYE, RIGHT_EYE, LEFT_EAR, RIGHT_EAR, LEFT_SHOULDER, RIGHT_SHOULDER = range(7)
+
+# キーポイントを有効とみなす信頼度の下限
+SCORE_THRESHOLD = 0.3
+
+
+def parse_args():
+    """コマンドライン引数のパース"""
+    parser = argparse.ArgumentParser(description="記録済みCSVからうつむき特徴量を再計算")
+    parser.add_argument("-c", "--csv", type=str, default="pose_output.csv",
+                        help="入力CSVファイルのパス (デフォルト: pose_output.csv)")
+    parser.add_argument("-o", "--output", type=str, default="pose_features.csv",
+                        help="出力CSVファイルのパス (デフォルト: pose_features.csv)")
+    parser.add_argument("--look-down-enter", type=float, default=LOOK_DOWN_ENTER,
+                        help=f"うつむき状態に入る閾値 (デフォルト: {LOOK_DOWN_ENTER})")
+    parser.add_argument("--look-down-exit", type=float, default=LOOK_DOWN_EXIT,
+                        help=f"うつむき状態から抜ける閾値 (デフォルト: {LOOK_DOWN_EXIT})")
+    return parser.parse_args()
+
+
+def keypoint_validity(keypoints, scores=None, score_threshold=SCORE_THRESHOLD):
+    """キーポイントごとの有効フラグ (N, 17) を返す
+
+    座標が0またはNaNの点は未検出として扱う。scoresが与えられた場合は
+    信頼度がscore_threshold未満の点も無効とする。
+    """
+    valid = np.all(keypoints != 0, axis=-1) & ~np.isnan(keypoints).any(axis=-1)
+    if scores is not None:
+        valid &= scores >= score_threshold
+    return valid
+
+
+def compute_head_pose_features(keypoints, scores=None, score_threshold=SCORE_THRESHOLD):
+    """N人分のキーポイント (N, 17, 2) から頭部姿勢の特徴量を計算
+
+    Returns:
+        特徴量名 -> 長さNの配列 の辞書。計算できない値はNaN。
+        - dist_ear_nose: 従来の判定値 nose_y - max(left_ear_y, right_ear_y)
+        - nose_ear_dy / nose_eye_dy / shoulder_nose_dy: 有効な点のみで計算したy方向の差
+        - scale: 正規化に用いる肩幅（肩が狭く写る場合は両耳間距離の2倍を下限とする）
+        - head_pitch: nose_ear_dy / scale（正の値ほどうつむいている）
+    """
+    keypoints = np.asarray(keypoints, dtype=float).reshape(-1, len(COCO_KEYPOINTS), 2)
+    valid = keypoint_validity(keypoints, scores, score_threshold)
+    x = np.where(valid, keypoints[..., 0], np.nan)
+    y = np.where(valid, keypoints[..., 1], np.nan)
+
+    # 耳・目は左右のうち低い位置（yが大きい方）を基準にする
+    ear_y = np.fmax(y[:, LEFT_EAR], y[:, RIGHT_EAR])
+    eye_y = np.fmax(y[:, LEFT_EYE], y[:, RIGHT_EYE])
+    shoulder_y = np.fmin(y[:, LEFT_SHOULDER], y[:, RIGHT_SHOULDER])
+
+    shoulder_width = np.hypot(x[:, LEFT_SHOULDER] - x[:, RIGHT_SHOULDER],
+                              y[:, LEFT_SHOULDER] - y[:, RIGHT_SHOULDER])
+    ear_width = np.hypot(x[:, LEFT_EAR] - x[:, RIGHT_EAR],
+                         y[:, LEFT_EAR] - y[:, RIGHT_EAR])
+    scale = np.fmax(shoulder_width, 2 * ear_width)
+    scale = np.where(scale > 0, scale, np.nan)
+
+    nose_ear_dy = y[:, NOSE] - ear_y
+    return {
+        "dist_ear_nose": keypoints[:, NOSE, 1] - np.maximum(keypoints[:, LEFT_EAR, 1],
+                                                            keypoints[:, RIGHT_EAR, 1]),
+        "nose_ear_dy": nose_ear_dy,
+        "nose_eye_dy": y[:, NOSE] - eye_y,
+        "shoulder_nose_dy": shoulder_y - y[:, NOSE],
+        "scale": scale,
+        "head_pitch": nose_ear_dy / scale,
+    }
+
+
+def tracked_object_scores(tracked_objects, detections):
+    """Norfairのトラッキング対象から、現在のフレームでのキーポイントの信頼度 (N, 17) を取得
+
+    このフレームの検出と対応付けられなかったオブジェクト（推定値のみで追跡中）の信頼度は0。
+    CSVの<keypoint>_confと同じ値になるよう小数3桁に丸めるため、記録済みCSVからの再計算でも
+    同じ特徴量が得られる。
+    """
+    matched = {id(detection) for detection in detections}
+    scores = np.zeros((len(tracked_objects), len(COCO_KEYPOINTS)))
+    for row, obj in enumerate(tracked_objects):
+        if id(obj.last_detection) in matched:
+            scores[row] = np.where(obj.live_points, obj.last_detection.scores, 0.0)
+    return np.round(scores, 3)
+
+
+class LookDownHysteresis:
+    """トラックごとのうつむき状態をヒステリシスで平滑化する
+
+    head_pitchがenter_threshold以上でうつむき、exit_threshold以下で解除。
+    その間の値やNaNの場合は直前の状態を維持する。
+    """
+
+    def __init__(self, enter_threshold=LOOK_DOWN_ENTER, exit_threshold=LOOK_DOWN_EXIT):
+        self.enter_threshold = enter_threshold
+        self.exit_threshold = exit_threshold
+        self._states = {}
+
+    def update(self, track_ids, head_pitch):
+        """1フレーム分のtracking_idとhead_pitchから、うつむき状態の配列を返す"""
+        previous = np.array([self._states.get(tid, False) for tid in track_ids], dtype=bool)
+        look_down = np.where(head_pitch >= self.enter_threshold, True,
+                             np.where(head_pitch <= self.exit_threshold, False, previous))
+
+        # 現在のフレームにいないトラックの状態は破棄
+        self._states = dict(zip(track_ids, look_down.tolist()))
+        return look_down
+
+
+def apply_hysteresis(track_ids, head_pitch,
+                     enter_threshold=LOOK_DOWN_ENTER, exit_threshold=LOOK_DOWN_EXIT):
+    """記録全体に対してLookDownHysteresisと同じ平滑化を一括で適用
+
+    入力はtracking_idごとにフレーム順で並んでいる必要がある。
+    """
+    marks = np.where(head_pitch >= enter_threshold, 1.0,
+                     np.where(head_pitch <= exit_threshold, 0.0, np.nan))
+    state = pd.Series(marks).groupby(np.asarray(track_ids)).ffill()
+    return state.fillna(0.0).to_numpy().astype(bool)
+
+
+def dataframe_keypoints(df):
+    """CSV形式のDataFrameからキーポイント配列 (N, 17, 2) を取り出す"""
+    columns = [kp + coord for kp in COCO_KEYPOINTS for coord in ["_x", "_y"]]
+    return df[columns].to_numpy(dtype=float).reshape(-1, len(COCO_KEYPOINTS), 2)
+
+
+def dataframe_scores(df):
+    """CSVに信頼度の列 (<keypoint>_conf) があれば (N, 17) の配列で返し、なければNone"""
+    columns = [kp + "_conf" for kp in COCO_KEYPOINTS]
+    if not set(columns).issubset(df.columns):
+        return None
+    return df[columns].to_numpy(dtype=float)
+
+
+def recompute_features(df, enter_threshold=LOOK_DOWN_ENTER, exit_threshold=LOOK_DOWN_EXIT):
+    """記録済みのトラッキング結果全体の特徴量とうつむき状態を再計算
+
+    検出は再実行せず、CSVのキーポイント座標（と信頼度の列があれば信頼度）から計算する。
+    """
+    df = df.dropna(subset=["tracking_id"]).sort_values(["tracking_id", "frame"]).copy()
+    df["tracking_id"] = df["tracking_id"].astype(int)
+
+    features = compute_head_pose_features(dataframe_keypoints(df), dataframe_scores(df))
+    for name, values in features.items():
+        df[name] = values
+    df["look_down"] = apply_hysteresis(df["tracking_id"].to_numpy(), df["head_pitch"].to_numpy(),
+                                       enter_threshold, exit_threshold)
+    return df.sort_values(["frame", "tracking_id"])
+
+
+def main():
+    """メイン処理"""
+    args = parse_args()
+
+    # CSVファイルの存在確認
+    if not Path(args.csv).exists():
+        print(f"エラー: CSVファイル '{args.csv}' が見つかりません")
+        return
+
+    print(f"CSVファイルを読み込んでいます: {args.csv}")
+    df = pd.read_csv(args.csv)
+
+    df = recompute_features(df, args.look_down_enter, args.look_down_exit)
+    df.to_csv(args.output, index=False)
+
+    print(f"うつむき判定の割合: {df['look_down'].mean() * 100:.1f}%")
+    print(f"特徴量を保存しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+常駐推論デーモン
+ultralytics/torch/norfairの読み込みとYOLOモデルのロードを1度だけ行い、
+pose_detection.py / pose_detection_selected.py からのジョブを順番に処理します
+
+通信はlocalhostのTCPで、1行1つのJSON（JSON Lines）をやり取りします:
+    クライアント -> デーモン: {"script": "pose_detection", "args": {...}}
+    デーモン -> クライアント: {"type": "queued", "position": 0}
+                              {"type": "log", "message": "処理中: フレーム 30"}
+                              {"type": "done"} または {"type": "error", "message": "..."}
+"""
+
+import argparse
+import importlib
+import ipaddress
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import traceback
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 50700
+
+# ジョブとして受け付けるスクリプト
+JOB_SCRIPTS = ("pose_detection", "pose_detection_selected")
+
+# デーモン側のカレントディレクトリに依存しないよう、絶対パスに変換する引数
+PATH_OPTIONS = ("input_video", "output", "csv", "frame_index", "model")
+
+# 接続後、デーモンからの最初の応答（ジョブの受付）を待つ秒数
+FIRST_REPLY_TIMEOUT = 5.0
+
+
+def parse_args():
+    """コマンドライン引数のパース"""
+    parser = argparse.ArgumentParser(description="常駐推論デーモン")
+    parser.add_argument("--host", type=str, default=DEFAULT_HOST,
+                        help=f"待ち受けるホスト、ループバックアドレスのみ (デフォルト: {DEFAULT_HOST})")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help=f"待ち受けるポート (デフォルト: {DEFAULT_PORT})")
+    parser.add_argument("--preload", type=str, nargs="*", default=["yolo11s-pose.pt"],
+                        help="起動時に読み込んでおくYOLOモデル (デフォルト: yolo11s-pose.pt)")
+    return parser.parse_args()
+
+
+def is_loopback(host):
+    """ホスト名が解決されるアドレスがすべてループバックアドレスかどうか
+
+    ジョブは任意のパスに出力を書き込めるため、デーモンは他のマシンから接続できないようにする。
+    """
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except socket.gaierror:
+        return False
+    return all(ipaddress.ip_address(address.split("%")[0]).is_loopback for address in addresses)
+
+
+def add_daemon_arguments(parser):
+    """デーモン利用に関する引数をスクリプトのパーサーに追加"""
+    parser.add_argument("--daemon-port", type=int, default=DEFAULT_PORT,
+                        help=f"推論デーモンのポート (デフォルト: {DEFAULT_PORT})")
+    parser.add_argument("--no-daemon", action="store_true",
+                        help="推論デーモンを使わずにこのプロセス内で処理する")
+
+
+def job_arguments(args):
+    """argparseの結果をデーモンに送れる辞書に変換（パスは絶対パス化）"""
+    job_args = vars(args).copy()
+    for name in PATH_OPTIONS:
+        value = job_args.get(name)
+        # モデル名だけが指定された場合（自動ダウンロード）はそのまま渡す
+        if value and (name != "model" or os.path.exists(value)):
+            job_args[name] = os.path.abspath(value)
+    return job_args
+
+
+def read_message(lines):
+    """デーモンからのメッセージを1件読み込む（切断や不正な応答の場合はNone）"""
+    try:
+        message = json.loads(next(lines))
+    except (StopIteration, ValueError, OSError):
+        return None
+    if not isinstance(message, dict) or "type" not in message:
+        return None
+    return message
+
+
+def submit_job(script, args, host=DEFAULT_HOST, port=DEFAULT_PORT, log=print):
+    """デーモンにジョブを送り、進捗を表示しながら完了を待つ
+
+    Returns:
+        デーモンがジョブを処理した場合True、デーモンが起動していない場合
+        （ポートで別のサービスが応答した場合を含む）False
+    """
+    try:
+        sock = socket.create_connection((host, port), timeout=0.5)
+    except OSError:
+        return False
+
+    with sock:
+        request = {"script": script, "args": job_arguments(args)}
+        try:
+            sock.settimeout(FIRST_REPLY_TIMEOUT)
+            sock.sendall((json.dumps(request, ensure_ascii=False) + "\n").encode("utf-8"))
+            lines = iter(sock.makefile("r", encoding="utf-8", errors="replace"))
+            message = read_message(lines)
+        except OSError:
+            message = None
+        if message is None or message["type"] not in ("queued", "error"):
+            log(f"警告: ポート {port} の応答が推論デーモンのものではないため、このプロセス内で処理します")
+            return False
+
+        # ジョブの受付後は完了まで待つ
+        sock.settimeout(None)
+        while message is not None:
+            if message["type"] == "queued":
+                log(f"推論デーモンにジョブを登録しました (待ちジョブ数: {message['position']})")
+            elif message["type"] == "log":
+                log(message["message"])
+            elif message["type"] == "error":
+                log(f"エラー: {message['message']}")
+                return True
+            elif message["type"] == "done":
+                return True
+            message = read_message(lines)
+
+    log("エラー: 推論デーモンとの接続が切断されました")
+    return True
+
+
+class Job:
+    """デーモンで処理する1件のジョブ"""
+
+    def __init__(self, script, args):
+        self.script = script
+        self.args = argparse.Namespace(**args)
+        self.messages = queue.Queue()
+
+    def log(self, message):
+        self.messages.put({"type": "log", "message": str(message)})
+
+
+class InferenceDaemon:
+    """モデルを保持したまま、ジョブを1件ずつ順番に処理する"""
+
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.models = {}
+        self._modules = {script: importlib.import_module(script) for script in JOB_SCRIPTS}
+
+        # スクリプト側で遅延importしているライブラリを先に読み込んでおく
+        for name in ("cv2", "norfair", "ultralytics", "head_pose_features", "tracking_output"):
+            importlib.import_module(name)
+
+    def get_model(self, model_path):
+        """読み込み済みのモデルを返す（未読み込みなら読み込んでキャッシュ）"""
+        if os.path.exists(model_path):
+            model_path = os.path.abspath(model_path)
+        if model_path not in self.models:
+            print(f"YOLOモデルを読み込んでいます: {model_path}")
+            self.models[model_path] = self._modules["pose_detection"].load_model(model_path)
+        return self.models[model_path]
+
+    def submit(self, job):
+        """ジョブをキューに追加し、先に待っているジョブ数を返す"""
+        position = self.jobs.qsize()
+        self.jobs.put(job)
+        return position
+
+    def run_job(self, job):
+        module = self._modules[job.script]
+        try:
+            model = self.get_model(job.args.model)
+            module.process_video(job.args, model, log=job.log, model_loader=self.get_model)
+            job.messages.put({"type": "done"})
+        except Exception as e:
+            traceback.print_exc()
+            job.messages.put({"type": "error", "message": f"{type(e).__name__}: {e}"})
+
+    def serve_jobs(self):
+        """ワーカースレッド: GPUを共有するためジョブは1件ずつ処理する"""
+        while True:
+            job = self.jobs.get()
+            print(f"ジョブを開始します: {job.script} {job.args.input_video}")
+            self.run_job(job)
+            print(f"ジョブが終了しました: {job.script} {job.args.input_video}")
+
+
+class JobRequestHandler(socketserver.StreamRequestHandler):
+    """クライアント接続ごとに、ジョブの登録と進捗の送信を行う"""
+
+    def send(self, message):
+        self.wfile.write((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            if request.get("script") not in JOB_SCRIPTS:
+                raise ValueError(f"未対応のスクリプトです: {request.get('script')}")
+            job = Job(request["script"], request["args"])
+        except (ValueError, KeyError, TypeError) as e:
+            self.send({"type": "error", "message": str(e)})
+            return
+
+        self.send({"type": "queued", "position": self.server.inference_daemon.submit(job)})
+
+        # クライアントが切断してもジョブ自体は最後まで処理される
+        while True:
+            message = job.messages.get()
+            try:
+                self.send(message)
+            except OSError:
+                return
+            if message["type"] in ("done", "error"):
+                return
+
+
+class DaemonServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, inference_daemon):
+        super().__init__(address, JobRequestHandler)
+        self.inference_daemon = inference_daemon
+
+
+def main():
+    """メイン処理"""
+    args = parse_args()
+
+    if not is_loopback(args.host):
+        print(f"エラー: ホスト '{args.host}' はループバックアドレスではありません "
+              f"(127.0.0.1 などのlocalhostのみ指定できます)")
+        return
+
+    print("ライブラリを読み込んでいます...")
+    daemon = InferenceDaemon()
+    for model_path in args.preload:
+        daemon.get_model(model_path)
+
+    threading.Thread(target=daemon.serve_jobs, daemon=True).start()
+
+    with DaemonServer((args.host, args.port), daemon) as server:
+        print(f"推論デーモンを起動しました: {args.host}:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\n推論デーモンを停止します")
+
+
+if __name__ == "__main__":
+    main()
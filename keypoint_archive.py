@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+"""
+キーポイントの長期保存用アーカイブ
+トラッキング結果のCSVを、tracking_idごと・一定時間ごとのチャンクに分け、
+座標をint16に量子化した差分として圧縮保存します。チャンクの索引（時間とtracking_id）を
+持つため、指定した時間範囲・IDのチャンクだけを読み出してNumPy配列に復元できます
+
+ファイル構成:
+    MAGIC (8バイト)
+    ヘッダー長 (uint32) + ヘッダー (JSON: fps、チャンク長、フレームサイズなど)
+    チャンク (zlib圧縮) x チャンク数
+    索引 (INDEX_DTYPEの配列)
+    フッター: 索引の位置 (uint64) + 索引の件数 (uint64) + MAGIC
+"""
+
+import argparse
+import json
+import struct
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+# COCOキーポイントの定義
+COCO_KEYPOINTS = [
+    "nose",
+    "left-eye",
+    "right-eye",
+    "left-ear",
+    "right-ear",
+    "left-shoulder",
+    "right-shoulder",
+    "left-elbow",
+    "right-elbow",
+    "left-wrist",
+    "right-wrist",
+    "left-hip",
+    "right-hip",
+    "left-knee",
+    "right-knee",
+    "left-ankle",
+    "right-ankle",
+]
+
+MAGIC = b"KPARCH01"
+FOOTER = struct.Struct("<QQ8s")
+
+COORD_COLUMNS = [kp + coord for kp in COCO_KEYPOINTS for coord in ["_x", "_y"]]
+CONF_COLUMNS = [kp + "_conf" for kp in COCO_KEYPOINTS]
+AGE_COLUMNS = [kp + "_age" for kp in COCO_KEYPOINTS]
+
+# 量子化後の座標の絶対値の上限（差分がint16に収まるように半分にする）
+MAX_QUANTIZED = 2 ** 14 - 1
+
+# 量子化スケールの上限（1/16ピクセル単位）
+MAX_SCALE = 16.0
+
+# 信頼度はCSVと同じ小数3桁で保存する（uint16の1/1000単位）
+CONF_SCALE = 1000
+
+# 一度も観測されていないキーポイントのage
+AGE_NEVER_OBSERVED = np.iinfo(np.uint16).max
+
+INDEX_DTYPE = np.dtype([
+    ("tracking_id", "<i8"),
+    ("start_frame", "<i8"),
+    ("end_frame", "<i8"),
+    ("rows", "<u4"),
+    ("scale", "<f4"),
+    ("offset", "<u8"),
+    ("length", "<u4"),
+])
+
+
+def parse_args():
+    """コマンドライン引数のパース"""
+    parser = argparse.ArgumentParser(description="キーポイントの長期保存用アーカイブ")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    encode_parser = subparsers.add_parser("encode", help="CSVをアーカイブに変換")
+    encode_parser.add_argument("csv", type=str, help="入力CSVファイルのパス")
+    encode_parser.add_argument("-o", "--output", type=str, default=None,
+                               help="アーカイブの出力先 (デフォルト: <CSV名>.kpa)")
+    encode_parser.add_argument("--fps", type=float, default=30.0,
+                               help="動画のフレームレート (デフォルト: 30)")
+    encode_parser.add_argument("--chunk-seconds", type=float, default=10.0,
+                               help="1チャンクの長さ[秒] (デフォルト: 10)")
+
+    read_parser = subparsers.add_parser("read", help="アーカイブから指定範囲を読み出す")
+    read_parser.add_argument("archive", type=str, help="アーカイブのパス")
+    read_parser.add_argument("-i", "--ids", type=str, default=None,
+                             help="読み出すTracking ID (カンマ区切り、指定しない場合は全員)")
+    read_parser.add_argument("--start", type=float, default=None, help="開始時刻[秒]")
+    read_parser.add_argument("--end", type=float, default=None, help="終了時刻[秒]")
+    read_parser.add_argument("-o", "--output", type=str, default=None,
+                             help="読み出した結果を保存するCSVのパス")
+
+    bench_parser = subparsers.add_parser("bench", help="CSVとアーカイブのサイズ・読み出し速度を比較")
+    bench_parser.add_argument("csv", type=str, help="比較するCSVファイルのパス")
+    bench_parser.add_argument("--fps", type=float, default=30.0,
+                              help="動画のフレームレート (デフォルト: 30)")
+    bench_parser.add_argument("--chunk-seconds", type=float, default=10.0,
+                              help="1チャンクの長さ[秒] (デフォルト: 10)")
+    bench_parser.add_argument("--repeat", type=int, default=5,
+                              help="読み出しの計測回数 (デフォルト: 5)")
+    return parser.parse_args()
+
+
+def to_bool(x):
+    if isinstance(x, str):
+        return x.lower() == "true"
+    return bool(x)
+
+
+def group_deltas(values, group_starts):
+    """各グループ内で行方向の差分を取る（グループの先頭行は値そのまま）"""
+    deltas = values.copy()
+    deltas[1:] -= values[:-1]
+    deltas[group_starts] = values[group_starts]
+    return deltas
+
+
+def encode_csv(csv_path, archive_path, fps=30.0, chunk_seconds=10.0):
+    """トラッキング結果のCSVをアーカイブに変換し、チャンク数を返す"""
+    df = pd.read_csv(csv_path)
+    frame_height = df["frame_height"].dropna()
+    frame_width = df["frame_width"].dropna()
+
+    df = df.dropna(subset=["tracking_id"])
+    df = df.assign(tracking_id=df["tracking_id"].astype(np.int64))
+    df = df.sort_values(["tracking_id", "frame"], kind="stable").reset_index(drop=True)
+
+    chunk_frames = max(1, int(round(chunk_seconds * fps)))
+    frames = df["frame"].to_numpy(dtype=np.int64)
+    tracking_ids = df["tracking_id"].to_numpy()
+    keys = np.column_stack([tracking_ids, frames // chunk_frames])
+    is_start = np.ones(len(df), dtype=bool)
+    is_start[1:] = np.any(keys[1:] != keys[:-1], axis=1)
+    group_starts = np.flatnonzero(is_start)
+    group_ends = np.append(group_starts[1:], len(df))
+
+    coords = df[COORD_COLUMNS]
+    valid = coords.notna().to_numpy()
+    # 欠損は直前の値で埋めて差分を0にする（復元時はvalidで欠損に戻す）
+    group_ids = np.cumsum(is_start)
+    coords = coords.groupby(group_ids).ffill().fillna(0.0).to_numpy()
+
+    # 座標の量子化。Norfairの推定値は画面外に大きく外れることがあるため、
+    # チャンクごとに値の範囲からスケールを決め、外れ値が精度を下げるのをそのチャンクに限定する
+    max_abs = np.maximum.reduceat(np.abs(coords).max(axis=1), group_starts)
+    scales = np.minimum(MAX_SCALE, MAX_QUANTIZED / np.maximum(max_abs, 1.0)).astype(np.float32)
+    row_scales = np.repeat(scales, group_ends - group_starts)[:, None]
+    quantized = np.clip(np.round(coords * row_scales), -MAX_QUANTIZED, MAX_QUANTIZED).astype(np.int16)
+
+    coord_deltas = group_deltas(quantized, group_starts)
+    frame_deltas = group_deltas(frames, group_starts).astype(np.int32)
+    look_down = df["look_down"].map(to_bool).to_numpy(dtype=bool)
+
+    has_conf = set(CONF_COLUMNS).issubset(df.columns)
+    has_age = set(AGE_COLUMNS).issubset(df.columns)
+    if has_conf:
+        conf = np.round(df[CONF_COLUMNS].fillna(0.0).to_numpy() * CONF_SCALE).astype(np.uint16)
+    if has_age:
+        age = df[AGE_COLUMNS].to_numpy(dtype=float)
+        age = np.where(np.isnan(age), AGE_NEVER_OBSERVED,
+                       np.clip(age, 0, AGE_NEVER_OBSERVED - 1)).astype(np.uint16)
+
+    header = {
+        "version": 2,
+        "fps": fps,
+        "chunk_frames": chunk_frames,
+        "frame_height": int(frame_height.iloc[0]) if len(frame_height) else None,
+        "frame_width": int(frame_width.iloc[0]) if len(frame_width) else None,
+        "keypoints": COCO_KEYPOINTS,
+        "has_conf": has_conf,
+        "has_age": has_age,
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+
+    index = np.zeros(len(group_starts), dtype=INDEX_DTYPE)
+    with open(archive_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+
+        for n, (start, end) in enumerate(zip(group_starts, group_ends)):
+            # 同じキーポイントの値が連続するよう、列ごとに並べてから圧縮する
+            parts = [
+                frame_deltas[start:end],
+                coord_deltas[start:end].T,
+                np.packbits(valid[start:end].T),
+                np.packbits(look_down[start:end]),
+            ]
+            if has_conf:
+                parts.append(conf[start:end].T)
+            if has_age:
+                parts.append(age[start:end].T)
+            payload = zlib.compress(b"".join(np.ascontiguousarray(p).tobytes() for p in parts), 9)
+
+            index[n] = (tracking_ids[start], frames[start], frames[end - 1], end - start,
+                        scales[n], f.tell(), len(payload))
+            f.write(payload)
+
+        index_offset = f.tell()
+        f.write(index.tobytes())
+        f.write(FOOTER.pack(index_offset, len(index), MAGIC))
+    return len(index)
+
+
+class KeypointArchive:
+    """アーカイブの読み出し（索引だけを読み込み、チャンクは必要な分だけ展開する）"""
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        if self._file.read(len(MAGIC)) != MAGIC:
+            self._file.close()
+            raise ValueError(f"'{path}' はキーポイントアーカイブではありません")
+        (header_len,) = struct.unpack("<I", self._file.read(4))
+        self.header = json.loads(self._file.read(header_len))
+
+        self._file.seek(-FOOTER.size, 2)
+        index_offset, index_count, magic = FOOTER.unpack(self._file.read(FOOTER.size))
+        if magic != MAGIC:
+            self._file.close()
+            raise ValueError(f"'{path}' のフッターが壊れています")
+        self._file.seek(index_offset)
+        self.index = np.frombuffer(self._file.read(index_count * INDEX_DTYPE.itemsize),
+                                   dtype=INDEX_DTYPE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    @property
+    def fps(self):
+        return self.header["fps"]
+
+    def tracking_ids(self):
+        return np.unique(self.index["tracking_id"]).tolist()
+
+    def _decode_chunk(self, entry):
+        self._file.seek(int(entry["offset"]))
+        buffer = zlib.decompress(self._file.read(int(entry["length"])))
+        n = int(entry["rows"])
+        num_keypoints = len(self.header["keypoints"])
+
+        pos = 0
+
+        def take(dtype, count):
+            nonlocal pos
+            array = np.frombuffer(buffer, dtype=dtype, count=count, offset=pos)
+            pos += array.nbytes
+            return array
+
+        frames = np.cumsum(take("<i4", n), dtype=np.int64)
+        coords = np.cumsum(take("<i2", 2 * num_keypoints * n).reshape(-1, n), axis=1, dtype=np.int32)
+        valid = np.unpackbits(take(np.uint8, (2 * num_keypoints * n + 7) // 8),
+                              count=2 * num_keypoints * n).reshape(-1, n).astype(bool)
+        look_down = np.unpackbits(take(np.uint8, (n + 7) // 8), count=n).astype(bool)
+
+        keypoints = np.where(valid, coords / entry["scale"], np.nan).astype(np.float32)
+        chunk = {
+            "frames": frames,
+            "keypoints": keypoints.T.reshape(n, num_keypoints, 2),
+            "look_down": look_down,
+        }
+        if self.header["has_conf"]:
+            # 再計算でCSVと同じ閾値判定になるよう、float64のまま1/1000に戻す
+            if self.header["version"] >= 2:
+                conf = take("<u2", num_keypoints * n) / CONF_SCALE
+            else:
+                conf = take(np.uint8, num_keypoints * n) / 255
+            chunk["conf"] = conf.reshape(-1, n).T
+        if self.header["has_age"]:
+            age = take("<u2", num_keypoints * n).reshape(-1, n).T.astype(np.float32)
+            chunk["age"] = np.where(age == AGE_NEVER_OBSERVED, np.nan, age)
+        return chunk
+
+    def read(self, tracking_ids=None, start_frame=None, end_frame=None):
+        """指定したIDとフレーム範囲 [start_frame, end_frame) を読み出す
+
+        Returns:
+            tracking_id -> {"frames": (n,), "keypoints": (n, 17, 2), "look_down": (n,),
+                            "conf": (n, 17), "age": (n, 17)} の辞書
+            （conf・ageは元のCSVに列があった場合のみ）
+        """
+        selected = np.ones(len(self.index), dtype=bool)
+        if tracking_ids is not None:
+            selected &= np.isin(self.index["tracking_id"], list(tracking_ids))
+        if start_frame is not None:
+            selected &= self.index["end_frame"] >= start_frame
+        if end_frame is not None:
+            selected &= self.index["start_frame"] < end_frame
+
+        chunks = {}
+        for entry in np.sort(self.index[selected], order="offset"):
+            chunks.setdefault(int(entry["tracking_id"]), []).append(self._decode_chunk(entry))
+
+        tracks = {}
+        for tid, parts in chunks.items():
+            track = {name: np.concatenate([p[name] for p in parts]) for name in parts[0]}
+            keep = np.ones(len(track["frames"]), dtype=bool)
+            if start_frame is not None:
+                keep &= track["frames"] >= start_frame
+            if end_frame is not None:
+                keep &= track["frames"] < end_frame
+            if keep.any():
+                tracks[tid] = {name: values[keep] for name, values in track.items()}
+        return tracks
+
+    def read_seconds(self, tracking_ids=None, start=None, end=None):
+        """時間範囲 [start, end) 秒を指定して読み出す"""
+        start_frame = int(np.ceil(start * self.fps)) if start is not None else None
+        end_frame = int(np.ceil(end * self.fps)) if end is not None else None
+        return self.read(tracking_ids, start_frame, end_frame)
+
+
+def tracks_to_dataframe(tracks):
+    """readの結果をCSVと同じ列名のDataFrameに変換"""
+    frames = []
+    for tid, track in tracks.items():
+        n = len(track["frames"])
+        data = {"frame": track["frames"]}
+        data.update(zip(COORD_COLUMNS, track["keypoints"].reshape(n, -1).T))
+        if "conf" in track:
+            data.update(zip(CONF_COLUMNS, track["conf"].T))
+        if "age" in track:
+            data.update(zip(AGE_COLUMNS, track["age"].T))
+        data["tracking_id"] = tid
+        data["look_down"] = track["look_down"]
+        frames.append(pd.DataFrame(data))
+    if not frames:
+        return pd.DataFrame(columns=["frame"] + COORD_COLUMNS + ["tracking_id", "look_down"])
+    return pd.concat(frames, ignore_index=True).sort_values(["frame", "tracking_id"])
+
+
+def best_time(func, repeat):
+    """funcを複数回実行し、最短の実行時間[秒]を返す"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark(csv_path, fps=30.0, chunk_seconds=10.0, repeat=5):
+    """CSVとアーカイブのサイズ、全体・一部の読み出し時間を比較して表示"""
+    archive_path = str(Path(csv_path).with_suffix(".bench.kpa"))
+    encode_time = best_time(lambda: encode_csv(csv_path, archive_path, fps, chunk_seconds), 1)
+
+    with KeypointArchive(archive_path) as archive:
+        ids = archive.tracking_ids()
+        first_id = ids[0] if ids else None
+        last_frame = int(archive.index["end_frame"].max()) if len(archive.index) else 0
+        # 記録の中央付近の1チャンク分の区間
+        window = (last_frame // 2, last_frame // 2 + archive.header["chunk_frames"])
+
+        def csv_window():
+            df = pd.read_csv(csv_path)
+            return df[(df["tracking_id"] == first_id)
+                      & (df["frame"] >= window[0]) & (df["frame"] < window[1])]
+
+        results = [
+            ("全体の読み出し", best_time(lambda: pd.read_csv(csv_path), repeat),
+             best_time(lambda: archive.read(), repeat)),
+            ("1人・1チャンク分の読み出し", best_time(csv_window, repeat),
+             best_time(lambda: archive.read([first_id], *window), repeat)),
+        ]
+
+    csv_size = Path(csv_path).stat().st_size
+    archive_size = Path(archive_path).stat().st_size
+    Path(archive_path).unlink()
+
+    print(f"{'':<28} {'CSV':>12} {'Archive':>12} {'Ratio':>8}")
+    print(f"{'サイズ [KB]':<28} {csv_size / 1024:>12.1f} {archive_size / 1024:>12.1f} "
+          f"{csv_size / archive_size:>7.1f}x")
+    for label, csv_time, archive_time in results:
+        print(f"{label + ' [ms]':<28} {csv_time * 1000:>12.2f} {archive_time * 1000:>12.2f} "
+              f"{csv_time / archive_time:>7.1f}x")
+    print(f"(変換時間: {encode_time * 1000:.1f} ms、tracking_id={first_id}、"
+          f"フレーム {window[0]}-{window[1]})")
+
+
+def main():
+    """メイン処理"""
+    args = parse_args()
+
+    if args.command in ("encode", "bench") and not Path(args.csv).exists():
+        print(f"エラー: CSVファイル '{args.csv}' が見つかりません")
+        return
+    if args.command == "read" and not Path(args.archive).exists():
+        print(f"エラー: アーカイブ '{args.archive}' が見つかりません")
+        return
+
+    if args.command == "encode":
+        output = args.output or str(Path(args.csv).with_suffix(".kpa"))
+        print(f"CSVファイルを変換しています: {args.csv}")
+        num_chunks = encode_csv(args.csv, output, args.fps, args.chunk_seconds)
+        print(f"アーカイブを保存しました: {output} (チャンク数: {num_chunks})")
+
+    elif args.command == "read":
+        try:
+            ids = [int(id_str.strip()) for id_str in args.ids.split(",")] if args.ids else None
+        except ValueError:
+            print("エラー: Tracking IDは整数をカンマ区切りで指定してください (例: 1,3,5)")
+            return
+        try:
+            archive = KeypointArchive(args.archive)
+        except ValueError as e:
+            print(f"エラー: {e}")
+            return
+        with archive:
+            tracks = archive.read_seconds(ids, args.start, args.end)
+        for tid, track in sorted(tracks.items()):
+            print(f"tracking_id {tid}: {len(track['frames'])} フレーム "
+                  f"({track['frames'][0]}-{track['frames'][-1]})")
+        if args.output:
+            tracks_to_dataframe(tracks).to_csv(args.output, index=False)
+            print(f"CSVを保存しました: {args.output}")
+
+    elif args.command == "bench":
+        benchmark(args.csv, args.fps, args.chunk_seconds, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
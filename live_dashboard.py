@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+リアルタイム集中度ダッシュボード
+トラッキング処理中の各フレームの結果（tracking ID、うつむき判定、直近の集中度）を
+Server-Sent Events (SSE) でブラウザに配信します
+
+推論ループは最新の状態を置き換えるだけで、送信は接続ごとのスレッドが行います。
+送信が追いつかないクライアントには途中の更新を飛ばして最新の状態だけを送るため、
+推論ループが待たされることはありません。
+"""
+
+import json
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+DEFAULT_PORT = 8080
+
+# クライアントへの送信間隔の下限[秒]（これより速い更新はまとめて送る）
+MIN_SEND_INTERVAL = 0.1
+
+# 更新がない間に接続を維持するためのコメント送信間隔[秒]
+KEEPALIVE_INTERVAL = 15.0
+
+DASHBOARD_HTML = """<!DOCTYPE html>
+<html lang="ja">
+<head>
+<meta charset="utf-8">
+<title>Concentration Dashboard</title>
+<style>
+  body { font-family: sans-serif; margin: 2em; }
+  table { border-collapse: collapse; min-width: 24em; }
+  th, td { border: 1px solid #ccc; padding: 0.3em 0.8em; text-align: right; }
+  .down { background: #f8d0d0; }
+  .up { background: #d0f0d0; }
+</style>
+</head>
+<body>
+<h1>Concentration Dashboard</h1>
+<p>Frame: <span id="frame">-</span> / Time: <span id="time">-</span> s /
+   Class Concentration: <span id="class">-</span> %</p>
+<table>
+  <thead><tr><th>Student ID</th><th>Look Down</th><th>Concentration Rate (%)</th></tr></thead>
+  <tbody id="tracks"></tbody>
+</table>
+<script>
+const source = new EventSource("/events");
+source.onmessage = (event) => {
+  const data = JSON.parse(event.data);
+  document.getElementById("frame").textContent = data.frame;
+  document.getElementById("time").textContent = data.time.toFixed(1);
+  document.getElementById("class").textContent =
+    data.class_concentration === null ? "-" : data.class_concentration.toFixed(1);
+  document.getElementById("tracks").innerHTML = data.tracks.map((t) =>
+    `<tr class="${t.look_down ? "down" : "up"}"><td>${t.id}</td>` +
+    `<td>${t.look_down}</td><td>${t.concentration.toFixed(1)}</td></tr>`).join("");
+};
+</script>
+</body>
+</html>
+"""
+
+
+class RollingConcentration:
+    """トラックごとに直近window_framesフレームの集中度（うつむいていない割合）を計算"""
+
+    def __init__(self, window_frames):
+        self.window_frames = window_frames
+        self._history = {}
+        self._look_down_counts = {}
+        self._last_seen = {}
+
+    def update(self, frame_num, track_ids, look_downs):
+        """1フレーム分の判定を追加し、各トラックの集中度[%]を返す"""
+        rates = []
+        for tid, look_down in zip(track_ids, look_downs):
+            history = self._history.setdefault(tid, deque())
+            history.append(bool(look_down))
+            self._look_down_counts[tid] = self._look_down_counts.get(tid, 0) + bool(look_down)
+            if len(history) > self.window_frames:
+                self._look_down_counts[tid] -= history.popleft()
+            self._last_seen[tid] = frame_num
+            rates.append(100.0 * (1 - self._look_down_counts[tid] / len(history)))
+
+        # 長い間現れていないトラックは破棄
+        for tid in [t for t, seen in self._last_seen.items()
+                    if frame_num - seen > self.window_frames]:
+            del self._history[tid], self._look_down_counts[tid], self._last_seen[tid]
+        return rates
+
+
+class DashboardRequestHandler(BaseHTTPRequestHandler):
+    """ダッシュボードのページとSSEのイベントストリームを返す"""
+
+    def do_GET(self):
+        if self.path == "/":
+            body = DASHBOARD_HTML.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == "/events":
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            try:
+                self.server.dashboard.stream(self.wfile)
+            except OSError:
+                pass
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *args):
+        # アクセスログで処理中の進捗表示を埋めないようにする
+        pass
+
+
+class LiveDashboard:
+    """推論ループから最新の状態を受け取り、接続中のクライアントに配信する"""
+
+    def __init__(self, port=DEFAULT_PORT, fps=30.0, window_seconds=60.0, host="127.0.0.1"):
+        self.fps = fps
+        self.concentration = RollingConcentration(max(1, int(window_seconds * fps)))
+        self._condition = threading.Condition()
+        self._version = 0
+        self._payload = None
+        self._closed = False
+
+        self._server = ThreadingHTTPServer((host, port), DashboardRequestHandler)
+        self._server.daemon_threads = True
+        self._server.dashboard = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def update(self, frame_num, track_ids, look_downs):
+        """1フレーム分の結果を反映（推論ループから呼ばれ、送信は待たない）"""
+        track_ids = [int(tid) for tid in track_ids]
+        look_downs = [bool(look_down) for look_down in look_downs]
+        rates = self.concentration.update(frame_num, track_ids, look_downs)
+        payload = json.dumps({
+            "frame": frame_num,
+            "time": frame_num / self.fps,
+            "tracks": [
+                {"id": tid, "look_down": look_down, "concentration": round(rate, 1)}
+                for tid, look_down, rate in zip(track_ids, look_downs, rates)
+            ],
+            "class_concentration": round(sum(rates) / len(rates), 1) if rates else None,
+        })
+        with self._condition:
+            self._payload = payload
+            self._version += 1
+            self._condition.notify_all()
+
+    def stream(self, wfile):
+        """1つのクライアントに最新の状態を送り続ける（接続ごとのスレッドで実行）"""
+        sent_version = 0
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._closed or self._version != sent_version,
+                    timeout=KEEPALIVE_INTERVAL,
+                )
+                if self._closed:
+                    return
+                version, payload = self._version, self._payload
+
+            if version == sent_version:
+                wfile.write(b": keepalive\n\n")
+            else:
+                # 送信中に届いた更新は次の送信でまとめて最新のものだけを送る
+                wfile.write(f"data: {payload}\n\n".encode("utf-8"))
+                sent_version = version
+            wfile.flush()
+
+            with self._condition:
+                self._condition.wait_for(lambda: self._closed, timeout=MIN_SEND_INTERVAL)
+
+    def close(self):
+        """サーバーを停止し、接続中のクライアントを切断"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""
+うつむき判定の閾値
+推論デーモンに処理を任せるクライアント側でも引数のデフォルト値に使うため、
+numpy/pandasを読み込まない独立したモジュールにしています
+"""
+
+# うつむき判定のヒステリシス閾値（head_pitch、肩幅で正規化した値）
+LOOK_DOWN_ENTER = 0.02
+LOOK_DOWN_EXIT = -0.02
@@ -4,38 +4,18 @@ YOLO11 Pose Detection and Tracking with Norfair
 人物の姿勢検出とトラッキング、うつむき判定を行うプログラム
 """
 
-import cv2
-import numpy as np
 import csv
 import os
 import argparse
 from pathlib import Path
 
-from norfair import Detection, Tracker, Video, draw_tracked_objects
-from norfair.distances import create_keypoints_voting_distance
-from ultralytics import YOLO
-
-
-# COCOキーポイントの定義
-COCO_KEYPOINTS = [
-    "nose",
-    "left-eye",
-    "right-eye",
-    "left-ear",
-    "right-ear",
-    "left-shoulder",
-    "right-shoulder",
-    "left-elbow",
-    "right-elbow",
-    "left-wrist",
-    "right-wrist",
-    "left-hip",
-    "right-hip",
-    "left-knee",
-    "right-knee",
-    "left-ankle",
-    "right-ankle",
-]
+from adaptive_controller import AdaptiveModelController
+from inference_daemon import add_daemon_arguments, submit_job
+from look_down_thresholds import LOOK_DOWN_ENTER, LOOK_DOWN_EXIT
+
+
+# 推論デーモンに送るジョブの種類
+SCRIPT_NAME = "pose_detection"
 
 
 def parse_args():
@@ -46,6 +26,8 @@ def parse_args():
                         help="出力動画ファイルのパス (デフォルト: output.mp4)")
     parser.add_argument("-c", "--csv", type=str, default="pose_output.csv",
                         help="出力CSVファイルのパス (デフォルト: pose_output.csv)")
+    parser.add_argument("--frame-index", type=str, default=None,
+                        help="フレームインデックスの出力先 (デフォルト: pose_output_frames.csv)")
     parser.add_argument("-m", "--model", type=str, default="yolo11s-pose.pt",
                         help="YOLOモデルのパス (デフォルト: yolo11s-pose.pt)")
     parser.add_argument("--detection-threshold", type=float, default=0.1,
@@ -58,53 +40,24 @@ def parse_args():
                         help="ヒットカウンター最大値 (デフォルト: 30)")
     parser.add_argument("--pointwise-hit-counter-max", type=int, default=10,
                         help="ポイント毎のヒットカウンター最大値 (デフォルト: 10)")
+    parser.add_argument("--look-down-enter", type=float, default=LOOK_DOWN_ENTER,
+                        help=f"うつむき状態に入るhead_pitchの閾値 (デフォルト: {LOOK_DOWN_ENTER})")
+    parser.add_argument("--look-down-exit", type=float, default=LOOK_DOWN_EXIT,
+                        help=f"うつむき状態から抜けるhead_pitchの閾値 (デフォルト: {LOOK_DOWN_EXIT})")
+    parser.add_argument("--target-fps", type=float, default=None,
+                        help="目標FPS。指定するとFPSを保つようにモデルと推論解像度を自動で切り替える")
+    parser.add_argument("--dashboard-port", type=int, default=None,
+                        help="リアルタイムダッシュボードのポート (指定しない場合は起動しない)")
+    parser.add_argument("--dashboard-window", type=float, default=60.0,
+                        help="ダッシュボードの集中度を計算する期間[秒] (デフォルト: 60)")
+    add_daemon_arguments(parser)
     return parser.parse_args()
 
 
-def create_csv_header():
-    """CSV出力用のヘッダーを作成"""
-    fieldnames_list = ["frame"]
-    fieldnames_list += [keypoints + coords for keypoints in COCO_KEYPOINTS
-                        for coords in ["_x", "_y"]]
-    fieldnames_list += ["frame_height", "frame_width", "tracking_id",
-                        "dist_ear_nose", "look_down"]
-    return fieldnames_list
-
-
-def write_empty_frame(writer, frame_num, video_h, video_w):
-    """人物が検出されなかった場合の空フレームをCSVに書き込み"""
-    csv_dict = {"frame": frame_num}
-    for field in COCO_KEYPOINTS:
-        csv_dict[field + "_x"] = None
-        csv_dict[field + "_y"] = None
-    csv_dict["frame_height"] = video_h
-    csv_dict["frame_width"] = video_w
-    csv_dict["tracking_id"] = None
-    csv_dict["dist_ear_nose"] = None
-    csv_dict["look_down"] = None
-    writer.writerow(csv_dict)
-
-
-def write_tracked_object(writer, frame_num, video_h, video_w, obj):
-    """トラッキングされたオブジェクトの情報をCSVに書き込み"""
-    csv_dict = {"frame": frame_num}
-    for field, coords in zip(COCO_KEYPOINTS, obj.estimate):
-        csv_dict[field + "_x"] = coords[0]
-        csv_dict[field + "_y"] = coords[1]
-    csv_dict["frame_height"] = video_h
-    csv_dict["frame_width"] = video_w
-    csv_dict["tracking_id"] = obj.id
-
-    # うつむきの判定
-    dist_ear_nose = obj.estimate[0, 1] - max(obj.estimate[3, 1], obj.estimate[4, 1])
-    csv_dict["dist_ear_nose"] = dist_ear_nose
-    csv_dict["look_down"] = dist_ear_nose >= 0
-
-    writer.writerow(csv_dict)
-
-
 def draw_look_down_status(frame, obj, look_down):
     """うつむき状態をフレームに描画"""
+    import cv2
+
     text = f"look_down: {str(look_down)}"
     position = (int(obj.estimate[0, 0]), int(obj.estimate[0, 1] - 10))
 
@@ -130,17 +83,52 @@ def main():
     print(f"出力CSV: {args.csv}")
     print(f"モデル: {args.model}")
 
+    # 推論デーモンが起動していればジョブを任せる
+    if not args.no_daemon and submit_job(SCRIPT_NAME, args, port=args.daemon_port):
+        return
+
     # YOLOモデルの読み込み
     print("YOLOモデルを読み込んでいます...")
-    model = YOLO(args.model)
+    model = load_model(args.model)
+    process_video(args, model)
+
+
+def load_model(model_path):
+    """YOLOモデルの読み込み"""
+    from ultralytics import YOLO
+
+    return YOLO(model_path)
+
+
+def process_video(args, model, log=print, model_loader=load_model):
+    """動画の姿勢検出・トラッキングを行い、動画とCSVを出力
+
+    args.target_fpsが指定された場合、modelに加えてmodel_loaderで読み込んだ
+    複数のモデルを処理速度に応じて切り替えて使う。
+    """
+    # 推論デーモンに処理を任せる場合の起動を軽くするため、処理に必要なライブラリはここで読み込む
+    import numpy as np
+    from norfair import Detection, Tracker, Video, draw_tracked_objects
+    from norfair.distances import create_keypoints_voting_distance
+
+    from head_pose_features import LookDownHysteresis, compute_head_pose_features
+    from live_dashboard import LiveDashboard
+    from tracking_output import (
+        FRAME_INDEX_FIELDS,
+        KeypointObservations,
+        create_csv_header,
+        frame_index_path,
+        write_frame_index,
+        write_tracked_object,
+    )
 
     # 動画の読み込み
-    print("動画を読み込んでいます...")
+    log("動画を読み込んでいます...")
     video = Video(input_path=args.input_video, output_path=args.output)
     video_h = video.input_height
     video_w = video.input_width
 
-    print(f"動画サイズ: {video_w}x{video_h}")
+    log(f"動画サイズ: {video_w}x{video_h}")
 
     # トラッカーの設定
     keypoint_dist_threshold = video_h / 40
@@ -156,58 +144,112 @@ def main():
         pointwise_hit_counter_max=args.pointwise_hit_counter_max,
     )
 
-    # CSV出力の準備
-    fieldnames_list = create_csv_header()
+    # モデル・推論解像度の自動切り替え（トラッカーは切り替え後もそのまま使う）
+    controller = None
+    if args.target_fps:
+        log(f"目標FPS: {args.target_fps}")
+        controller = AdaptiveModelController(args.target_fps, model_loader,
+                                             initial_model=args.model, model=model, log=log)
 
-    print("処理を開始します...")
-    with open(args.csv, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames_list)
-        writer.writeheader()
+    # うつむき判定の平滑化
+    look_down_filter = LookDownHysteresis(args.look_down_enter, args.look_down_exit)
 
-        for i, frame in enumerate(video):
-            if i % 30 == 0:  # 30フレームごとに進捗を表示
-                print(f"処理中: フレーム {i}")
+    # キーポイントごとの信頼度と最終観測からのフレーム数
+    observations = KeypointObservations(args.detection_threshold)
 
-            # キーポイントの検出
-            results = model(frame, save=False, verbose=False)[0]
-
-            # 人物が検出されない場合はスキップ
-            if results.keypoints.conf is None:
-                write_empty_frame(writer, i, video_h, video_w)
+    # CSV出力の準備
+    fieldnames_list = create_csv_header()
+    frame_index = args.frame_index or frame_index_path(args.csv)
+
+    # リアルタイムダッシュボード
+    dashboard = None
+    if args.dashboard_port:
+        dashboard = LiveDashboard(args.dashboard_port, fps=video.output_fps or 30.0,
+                                  window_seconds=args.dashboard_window)
+        log(f"ダッシュボード: {dashboard.url}")
+
+    # 処理が途中で失敗しても（デーモン内のジョブなど）ポートを解放する
+    try:
+        log("処理を開始します...")
+        with open(args.csv, "w", newline="", encoding="utf-8") as f, \
+                open(frame_index, "w", newline="", encoding="utf-8") as f_index:
+            writer = csv.DictWriter(f, fieldnames_list)
+            writer.writeheader()
+            index_writer = csv.DictWriter(f_index, FRAME_INDEX_FIELDS)
+            index_writer.writeheader()
+
+            for i, frame in enumerate(video):
+                if i % 30 == 0:  # 30フレームごとに進捗を表示
+                    log(f"処理中: フレーム {i}")
+
+                # キーポイントの検出
+                if controller is not None:
+                    controller.tick()
+                    results = controller.infer(frame)
+                else:
+                    results = model(frame, save=False, verbose=False)[0]
+
+                # 人物が検出されない場合はスキップ
+                if results.keypoints.conf is None:
+                    write_frame_index(index_writer, i, 0, 0)
+                    video.write(frame)
+                    tracked_objects = tracker.update()
+                    if dashboard is not None:
+                        dashboard.update(i, [], [])
+                    continue
+
+                # トラッキングの実行
+                detections = [
+                    Detection(np.array(p), scores=s)
+                    for (p, s) in zip(results.keypoints.xy.cpu().numpy(),
+                                      results.keypoints.conf.cpu().numpy())
+                ]
+                tracked_objects = tracker.update(detections=detections)
+                draw_tracked_objects(frame, tracked_objects)
+
+                write_frame_index(index_writer, i, len(detections), len(tracked_objects))
+
+                if not tracked_objects:
+                    if dashboard is not None:
+                        dashboard.update(i, [], [])
+                else:
+                    # キーポイントの信頼度（CSVの<keypoint>_confと同じ値を判定にも使う）
+                    confs, ages = observations.update(i, tracked_objects, detections)
+
+                    # うつむきの判定（フレーム内の全員分をまとめて計算）
+                    features = compute_head_pose_features(
+                        np.stack([obj.estimate for obj in tracked_objects]), confs
+                    )
+                    look_downs = look_down_filter.update(
+                        [obj.id for obj in tracked_objects], features["head_pitch"]
+                    )
+                    if dashboard is not None:
+                        dashboard.update(i, [obj.id for obj in tracked_objects], look_downs)
+
+                    for obj, conf, age, dist_ear_nose, head_pitch, look_down in zip(
+                            tracked_objects, confs, ages, features["dist_ear_nose"],
+                            features["head_pitch"], look_downs):
+                        # フレームに描画
+                        draw_look_down_status(frame, obj, look_down)
+
+                        # CSVに書き込み
+                        write_tracked_object(writer, i, video_h, video_w, obj, conf, age,
+                                             dist_ear_nose, head_pitch, look_down)
+
+                # 動画の出力
                 video.write(frame)
-                tracked_objects = tracker.update()
-                continue
-
-            # トラッキングの実行
-            detections = [
-                Detection(np.array(p), scores=s)
-                for (p, s) in zip(results.keypoints.xy.cpu().numpy(),
-                                  results.keypoints.conf.cpu().numpy())
-            ]
-            tracked_objects = tracker.update(detections=detections)
-            draw_tracked_objects(frame, tracked_objects)
-
-            if not tracked_objects:
-                write_empty_frame(writer, i, video_h, video_w)
-            else:
-                for obj in tracked_objects:
-                    # うつむきの判定
-                    dist_ear_nose = obj.estimate[0, 1] - max(obj.estimate[3, 1],
-                                                              obj.estimate[4, 1])
-                    look_down = dist_ear_nose >= 0
-
-                    # フレームに描画
-                    draw_look_down_status(frame, obj, look_down)
-
-                    # CSVに書き込み
-                    write_tracked_object(writer, i, video_h, video_w, obj)
-
-            # 動画の出力
-            video.write(frame)
-
-    print(f"\n処理が完了しました！")
-    print(f"出力動画: {args.output}")
-    print(f"出力CSV: {args.csv}")
+    finally:
+        if dashboard is not None:
+            dashboard.close()
+
+    if controller is not None:
+        log(f"\nモデル切り替え回数: {len(controller.switches)} "
+            f"(最終: {controller.model_name}@{controller.imgsz}, {controller.fps:.1f} fps)")
+
+    log(f"\n処理が完了しました！")
+    log(f"出力動画: {args.output}")
+    log(f"出力CSV: {args.csv}")
+    log(f"フレームインデックス: {frame_index}")
 
 
 if __name__ == "__main__":
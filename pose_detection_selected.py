@@ -4,36 +4,17 @@ YOLO11 Pose Detection and Tracking with Norfair (Selected IDs)
 指定したTracking IDのみを出力する姿勢検出・トラッキングプログラム
 """
 
-import numpy as np
 import csv
 import os
 import argparse
 
-from norfair import Detection, Tracker, Video, draw_tracked_objects
-from norfair.distances import create_keypoints_voting_distance
-from ultralytics import YOLO
-
-
-# COCOキーポイントの定義
-COCO_KEYPOINTS = [
-    "nose",
-    "left-eye",
-    "right-eye",
-    "left-ear",
-    "right-ear",
-    "left-shoulder",
-    "right-shoulder",
-    "left-elbow",
-    "right-elbow",
-    "left-wrist",
-    "right-wrist",
-    "left-hip",
-    "right-hip",
-    "left-knee",
-    "right-knee",
-    "left-ankle",
-    "right-ankle",
-]
+from adaptive_controller import AdaptiveModelController
+from inference_daemon import add_daemon_arguments, submit_job
+from look_down_thresholds import LOOK_DOWN_ENTER, LOOK_DOWN_EXIT
+
+
+# 推論デーモンに送るジョブの種類
+SCRIPT_NAME = "pose_detection_selected"
 
 
 def parse_args():
@@ -46,6 +27,8 @@ def parse_args():
                         help="出力動画ファイルのパス (デフォルト: output_selected.mp4)")
     parser.add_argument("-c", "--csv", type=str, default="pose_output_selected.csv",
                         help="出力CSVファイルのパス (デフォルト: pose_output_selected.csv)")
+    parser.add_argument("--frame-index", type=str, default=None,
+                        help="フレームインデックスの出力先 (デフォルト: pose_output_selected_frames.csv)")
     parser.add_argument("-m", "--model", type=str, default="yolo11s-pose.pt",
                         help="YOLOモデルのパス (デフォルト: yolo11s-pose.pt)")
     parser.add_argument("--detection-threshold", type=float, default=0.1,
@@ -58,6 +41,13 @@ def parse_args():
                         help="ヒットカウンター最大値 (デフォルト: 30)")
     parser.add_argument("--pointwise-hit-counter-max", type=int, default=10,
                         help="ポイント毎のヒットカウンター最大値 (デフォルト: 10)")
+    parser.add_argument("--look-down-enter", type=float, default=LOOK_DOWN_ENTER,
+                        help=f"うつむき状態に入るhead_pitchの閾値 (デフォルト: {LOOK_DOWN_ENTER})")
+    parser.add_argument("--look-down-exit", type=float, default=LOOK_DOWN_EXIT,
+                        help=f"うつむき状態から抜けるhead_pitchの閾値 (デフォルト: {LOOK_DOWN_EXIT})")
+    parser.add_argument("--target-fps", type=float, default=None,
+                        help="目標FPS。指定するとFPSを保つようにモデルと推論解像度を自動で切り替える")
+    add_daemon_arguments(parser)
     return parser.parse_args()
 
 
@@ -70,48 +60,6 @@ def parse_tracking_ids(ids_str):
         raise ValueError("Tracking IDは整数をカンマ区切りで指定してください (例: 1,3,5)")
 
 
-def create_csv_header():
-    """CSV出力用のヘッダーを作成"""
-    fieldnames_list = ["frame"]
-    fieldnames_list += [keypoints + coords for keypoints in COCO_KEYPOINTS
-                        for coords in ["_x", "_y"]]
-    fieldnames_list += ["frame_height", "frame_width", "tracking_id",
-                        "dist_ear_nose", "look_down"]
-    return fieldnames_list
-
-
-def write_empty_frame(writer, frame_num, video_h, video_w):
-    """人物が検出されなかった場合の空フレームをCSVに書き込み"""
-    csv_dict = {"frame": frame_num}
-    for field in COCO_KEYPOINTS:
-        csv_dict[field + "_x"] = None
-        csv_dict[field + "_y"] = None
-    csv_dict["frame_height"] = video_h
-    csv_dict["frame_width"] = video_w
-    csv_dict["tracking_id"] = None
-    csv_dict["dist_ear_nose"] = None
-    csv_dict["look_down"] = None
-    writer.writerow(csv_dict)
-
-
-def write_tracked_object(writer, frame_num, video_h, video_w, obj):
-    """トラッキングされたオブジェクトの情報をCSVに書き込み"""
-    csv_dict = {"frame": frame_num}
-    for field, coords in zip(COCO_KEYPOINTS, obj.estimate):
-        csv_dict[field + "_x"] = coords[0]
-        csv_dict[field + "_y"] = coords[1]
-    csv_dict["frame_height"] = video_h
-    csv_dict["frame_width"] = video_w
-    csv_dict["tracking_id"] = obj.id
-
-    # うつむきの判定
-    dist_ear_nose = obj.estimate[0, 1] - max(obj.estimate[3, 1], obj.estimate[4, 1])
-    csv_dict["dist_ear_nose"] = dist_ear_nose
-    csv_dict["look_down"] = dist_ear_nose >= 0
-
-    writer.writerow(csv_dict)
-
-
 def main():
     """メイン処理"""
     args = parse_args()
@@ -134,17 +82,53 @@ def main():
     print(f"出力CSV: {args.csv}")
     print(f"モデル: {args.model}")
 
+    # 推論デーモンが起動していればジョブを任せる
+    if not args.no_daemon and submit_job(SCRIPT_NAME, args, port=args.daemon_port):
+        return
+
     # YOLOモデルの読み込み
     print("YOLOモデルを読み込んでいます...")
-    model = YOLO(args.model)
+    model = load_model(args.model)
+    process_video(args, model)
+
+
+def load_model(model_path):
+    """YOLOモデルの読み込み"""
+    from ultralytics import YOLO
+
+    return YOLO(model_path)
+
+
+def process_video(args, model, log=print, model_loader=load_model):
+    """動画の姿勢検出・トラッキングを行い、動画とCSVを出力
+
+    args.target_fpsが指定された場合、modelに加えてmodel_loaderで読み込んだ
+    複数のモデルを処理速度に応じて切り替えて使う。
+    """
+    # 推論デーモンに処理を任せる場合の起動を軽くするため、処理に必要なライブラリはここで読み込む
+    import numpy as np
+    from norfair import Detection, Tracker, Video, draw_tracked_objects
+    from norfair.distances import create_keypoints_voting_distance
+
+    from head_pose_features import LookDownHysteresis, compute_head_pose_features
+    from tracking_output import (
+        FRAME_INDEX_FIELDS,
+        KeypointObservations,
+        create_csv_header,
+        frame_index_path,
+        write_frame_index,
+        write_tracked_object,
+    )
+
+    selected_ids = parse_tracking_ids(args.ids)
 
     # 動画の読み込み
-    print("動画を読み込んでいます...")
+    log("動画を読み込んでいます...")
     video = Video(input_path=args.input_video, output_path=args.output)
     video_h = video.input_height
     video_w = video.input_width
 
-    print(f"動画サイズ: {video_w}x{video_h}")
+    log(f"動画サイズ: {video_w}x{video_h}")
 
     # トラッカーの設定
     keypoint_dist_threshold = video_h / 40
@@ -160,24 +144,45 @@ def main():
         pointwise_hit_counter_max=args.pointwise_hit_counter_max,
     )
 
+    # モデル・推論解像度の自動切り替え（トラッカーは切り替え後もそのまま使う）
+    controller = None
+    if args.target_fps:
+        log(f"目標FPS: {args.target_fps}")
+        controller = AdaptiveModelController(args.target_fps, model_loader,
+                                             initial_model=args.model, model=model, log=log)
+
+    # うつむき判定の平滑化
+    look_down_filter = LookDownHysteresis(args.look_down_enter, args.look_down_exit)
+
+    # キーポイントごとの信頼度と最終観測からのフレーム数
+    observations = KeypointObservations(args.detection_threshold)
+
     # CSV出力の準備
     fieldnames_list = create_csv_header()
+    frame_index = args.frame_index or frame_index_path(args.csv)
 
-    print("処理を開始します...")
-    with open(args.csv, "w", newline="", encoding="utf-8") as f:
+    log("処理を開始します...")
+    with open(args.csv, "w", newline="", encoding="utf-8") as f, \
+            open(frame_index, "w", newline="", encoding="utf-8") as f_index:
         writer = csv.DictWriter(f, fieldnames_list)
         writer.writeheader()
+        index_writer = csv.DictWriter(f_index, FRAME_INDEX_FIELDS)
+        index_writer.writeheader()
 
         for i, frame in enumerate(video):
             if i % 30 == 0:  # 30フレームごとに進捗を表示
-                print(f"処理中: フレーム {i}")
+                log(f"処理中: フレーム {i}")
 
             # キーポイントの検出
-            results = model(frame, save=False, verbose=False)[0]
+            if controller is not None:
+                controller.tick()
+                results = controller.infer(frame)
+            else:
+                results = model(frame, save=False, verbose=False)[0]
 
             # 人物が検出されない場合はスキップ
             if results.keypoints.conf is None:
-                write_empty_frame(writer, i, video_h, video_w)
+                write_frame_index(index_writer, i, 0, 0)
                 video.write(frame)
                 tracked_objects = tracker.update()
                 continue
@@ -196,25 +201,39 @@ def main():
             # 選択されたIDのみを描画
             draw_tracked_objects(frame, selected_objects)
 
-            if not selected_objects:
-                write_empty_frame(writer, i, video_h, video_w)
-            else:
-                for obj in selected_objects:
-                    # うつむきの判定
-                    dist_ear_nose = obj.estimate[0, 1] - max(obj.estimate[3, 1],
-                                                              obj.estimate[4, 1])
-                    look_down = dist_ear_nose >= 0
+            write_frame_index(index_writer, i, len(detections), len(selected_objects))
+
+            if selected_objects:
+                # キーポイントの信頼度（CSVの<keypoint>_confと同じ値を判定にも使う）
+                confs, ages = observations.update(i, selected_objects, detections)
+
+                # うつむきの判定（選択された全員分をまとめて計算）
+                features = compute_head_pose_features(
+                    np.stack([obj.estimate for obj in selected_objects]), confs
+                )
+                look_downs = look_down_filter.update(
+                    [obj.id for obj in selected_objects], features["head_pitch"]
+                )
 
+                for obj, conf, age, dist_ear_nose, head_pitch, look_down in zip(
+                        selected_objects, confs, ages, features["dist_ear_nose"],
+                        features["head_pitch"], look_downs):
                     # CSVに書き込み
-                    write_tracked_object(writer, i, video_h, video_w, obj)
+                    write_tracked_object(writer, i, video_h, video_w, obj, conf, age,
+                                         dist_ear_nose, head_pitch, look_down)
 
             # 動画の出力
             video.write(frame)
 
-    print(f"\n処理が完了しました！")
-    print(f"出力動画: {args.output}")
-    print(f"出力CSV: {args.csv}")
-    print(f"選択されたTracking ID: {sorted(selected_ids)}")
+    if controller is not None:
+        log(f"\nモデル切り替え回数: {len(controller.switches)} "
+            f"(最終: {controller.model_name}@{controller.imgsz}, {controller.fps:.1f} fps)")
+
+    log(f"\n処理が完了しました！")
+    log(f"出力動画: {args.output}")
+    log(f"出力CSV: {args.csv}")
+    log(f"フレームインデックス: {frame_index}")
+    log(f"選択されたTracking ID: {sorted(selected_ids)}")
 
 
 if __name__ == "__main__":
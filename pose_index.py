@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+トラッキング結果のSQLiteインデックス
+CSVをインデックス付きのSQLiteデータベースに取り込み、
+時間範囲や人物ごとのうつむき集計をCSV全体を読み込まずに検索します
+"""
+
+import argparse
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+# COCOキーポイントの定義
+COCO_KEYPOINTS = [
+    "nose",
+    "left-eye",
+    "right-eye",
+    "left-ear",
+    "right-ear",
+    "left-shoulder",
+    "right-shoulder",
+    "left-elbow",
+    "right-elbow",
+    "left-wrist",
+    "right-wrist",
+    "left-hip",
+    "right-hip",
+    "left-knee",
+    "right-knee",
+    "left-ankle",
+    "right-ankle",
+]
+
+KEYPOINT_COLUMNS = [kp + coord for kp in COCO_KEYPOINTS for coord in ["_x", "_y"]]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    source TEXT,
+    fps REAL NOT NULL,
+    frame_height INTEGER,
+    frame_width INTEGER,
+    imported_at TEXT
+);
+CREATE TABLE IF NOT EXISTS keypoints (
+    session_id INTEGER NOT NULL,
+    tracking_id INTEGER NOT NULL,
+    frame INTEGER NOT NULL,
+    {", ".join(f'"{col}" REAL' for col in KEYPOINT_COLUMNS)},
+    head_pitch REAL,
+    look_down INTEGER,
+    PRIMARY KEY (session_id, tracking_id, frame)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS keypoints_by_frame ON keypoints (session_id, frame);
+CREATE TABLE IF NOT EXISTS track_summaries (
+    session_id INTEGER NOT NULL,
+    tracking_id INTEGER NOT NULL,
+    first_frame INTEGER NOT NULL,
+    last_frame INTEGER NOT NULL,
+    total_frames INTEGER NOT NULL,
+    look_down_frames INTEGER NOT NULL,
+    PRIMARY KEY (session_id, tracking_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS look_down_seconds (
+    session_id INTEGER NOT NULL,
+    tracking_id INTEGER NOT NULL,
+    second INTEGER NOT NULL,
+    frames INTEGER NOT NULL,
+    look_down_frames INTEGER NOT NULL,
+    PRIMARY KEY (session_id, tracking_id, second)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS look_down_seconds_by_second ON look_down_seconds (session_id, second);
+"""
+
+
+def parse_args():
+    """コマンドライン引数のパース"""
+    parser = argparse.ArgumentParser(description="トラッキング結果のSQLiteインデックス")
+    parser.add_argument("-d", "--db", type=str, default="pose_index.db",
+                        help="データベースファイルのパス (デフォルト: pose_index.db)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="CSVをデータベースに取り込む")
+    import_parser.add_argument("csv", type=str, help="取り込むCSVファイルのパス")
+    import_parser.add_argument("-s", "--session", type=str, default=None,
+                               help="セッション名 (デフォルト: CSVファイル名)")
+    import_parser.add_argument("--fps", type=float, default=30.0,
+                               help="動画のフレームレート (デフォルト: 30)")
+
+    subparsers.add_parser("sessions", help="取り込み済みのセッションを表示")
+
+    look_down_parser = subparsers.add_parser("look-down", help="時間範囲内のうつむき時間を集計")
+    look_down_parser.add_argument("-s", "--session", type=str, default=None,
+                                  help="セッション名 (指定しない場合は全セッション)")
+    look_down_parser.add_argument("--start", type=float, default=None,
+                                  help="集計開始時刻[秒] (1秒単位に切り捨て)")
+    look_down_parser.add_argument("--end", type=float, default=None,
+                                  help="集計終了時刻[秒] (1秒単位に切り上げ)")
+    look_down_parser.add_argument("--min-seconds", type=float, default=0.0,
+                                  help="表示するうつむき時間の下限[秒] (デフォルト: 0)")
+
+    summary_parser = subparsers.add_parser("summary", help="人物ごとの集中度を表示")
+    summary_parser.add_argument("-s", "--session", type=str, required=True,
+                                help="セッション名")
+    summary_parser.add_argument("-t", "--tracking-id", type=int, default=None,
+                                help="表示するtracking ID (指定しない場合は全員)")
+    return parser.parse_args()
+
+
+def connect(db_path):
+    """データベースに接続し、必要なテーブルとインデックスを作成"""
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def session_id(conn, name):
+    """セッション名からsession_idを取得"""
+    row = conn.execute("SELECT session_id FROM sessions WHERE name = ?", (name,)).fetchone()
+    if row is None:
+        raise ValueError(f"セッション '{name}' は存在しません")
+    return row[0]
+
+
+def to_bool(x):
+    if isinstance(x, str):
+        return x.lower() == "true"
+    return bool(x)
+
+
+def import_csv(conn, csv_path, name=None, fps=30.0):
+    """トラッキング結果のCSVを取り込み、人物ごと・1秒ごとの集計も作成
+
+    同じ名前のセッションが既にある場合は置き換える。
+    """
+    name = name or Path(csv_path).stem
+    df = pd.read_csv(csv_path)
+    frame_height = df["frame_height"].dropna()
+    frame_width = df["frame_width"].dropna()
+
+    df = df.dropna(subset=["tracking_id"]).copy()
+    df["tracking_id"] = df["tracking_id"].astype(int)
+    df["look_down"] = df["look_down"].apply(to_bool).astype(int)
+    if "head_pitch" not in df.columns:
+        df["head_pitch"] = np.nan
+    df["second"] = (df["frame"] // fps).astype(int)
+
+    with conn:
+        old = conn.execute("SELECT session_id FROM sessions WHERE name = ?", (name,)).fetchone()
+        if old is not None:
+            for table in ("sessions", "keypoints", "track_summaries", "look_down_seconds"):
+                conn.execute(f"DELETE FROM {table} WHERE session_id = ?", old)
+
+        sid = conn.execute(
+            "INSERT INTO sessions (name, source, fps, frame_height, frame_width, imported_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (name, str(Path(csv_path).resolve()), fps,
+             int(frame_height.iloc[0]) if len(frame_height) else None,
+             int(frame_width.iloc[0]) if len(frame_width) else None,
+             datetime.now().isoformat(timespec="seconds")),
+        ).lastrowid
+
+        # フレームごとのキーポイント（NaNはNULLとして保存）
+        columns = ["tracking_id", "frame"] + KEYPOINT_COLUMNS + ["head_pitch", "look_down"]
+        rows = df[columns].astype(object).where(df[columns].notna(), None)
+        quoted = ", ".join(f'"{col}"' for col in columns)
+        conn.executemany(
+            f"INSERT INTO keypoints (session_id, {quoted}) "
+            f"VALUES (?, {', '.join('?' * len(columns))})",
+            ((sid, *row) for row in rows.itertuples(index=False)),
+        )
+
+        # 人物ごとの集計
+        summaries = df.groupby("tracking_id").agg(
+            first_frame=("frame", "min"),
+            last_frame=("frame", "max"),
+            total_frames=("frame", "size"),
+            look_down_frames=("look_down", "sum"),
+        )
+        conn.executemany(
+            "INSERT INTO track_summaries VALUES (?, ?, ?, ?, ?, ?)",
+            ((sid, *map(int, row)) for row in summaries.reset_index().itertuples(index=False)),
+        )
+
+        # 1秒ごとのうつむきフレーム数
+        seconds = df.groupby(["tracking_id", "second"]).agg(
+            frames=("frame", "size"),
+            look_down_frames=("look_down", "sum"),
+        )
+        conn.executemany(
+            "INSERT INTO look_down_seconds VALUES (?, ?, ?, ?, ?)",
+            ((sid, *map(int, row)) for row in seconds.reset_index().itertuples(index=False)),
+        )
+    return sid
+
+
+def list_sessions(conn):
+    """取り込み済みのセッション一覧"""
+    return conn.execute(
+        "SELECT s.name, s.fps, s.imported_at, COUNT(t.tracking_id) "
+        "FROM sessions s LEFT JOIN track_summaries t USING (session_id) "
+        "GROUP BY s.session_id ORDER BY s.name"
+    ).fetchall()
+
+
+def look_down_totals(conn, session=None, start=None, end=None, min_seconds=0.0):
+    """時間範囲 [start, end) 秒の人物ごとのうつむき時間と検出時間（秒）
+
+    look_down_secondsは1秒単位の集計のため、範囲は外側の整数秒に広げられる
+    （[floor(start), ceil(end))。例えば start=10.5 の場合は10秒台全体が含まれる）。
+
+    Returns:
+        (セッション名, tracking_id, うつむき時間[秒], 検出時間[秒]) のリスト（うつむき時間の降順）
+    """
+    conditions = []
+    params = []
+    if session is not None:
+        conditions.append("l.session_id = ?")
+        params.append(session_id(conn, session))
+    if start is not None:
+        conditions.append("l.second >= ?")
+        params.append(int(np.floor(start)))
+    if end is not None:
+        conditions.append("l.second < ?")
+        params.append(int(np.ceil(end)))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    return conn.execute(
+        "SELECT s.name, l.tracking_id, "
+        "       SUM(l.look_down_frames) / s.fps AS look_down_seconds, "
+        "       SUM(l.frames) / s.fps AS observed_seconds "
+        "FROM look_down_seconds l JOIN sessions s USING (session_id) "
+        f"{where} "
+        "GROUP BY l.session_id, l.tracking_id "
+        "HAVING look_down_seconds >= ? "
+        "ORDER BY look_down_seconds DESC",
+        (*params, min_seconds),
+    ).fetchall()
+
+
+def track_summaries(conn, session, tracking_id=None):
+    """人物ごとの集計（検出フレーム数、うつむきフレーム数、集中度[%]）"""
+    params = [session_id(conn, session)]
+    where = "WHERE session_id = ?"
+    if tracking_id is not None:
+        where += " AND tracking_id = ?"
+        params.append(tracking_id)
+    return conn.execute(
+        "SELECT tracking_id, first_frame, last_frame, total_frames, look_down_frames, "
+        "       100.0 * (1 - CAST(look_down_frames AS REAL) / total_frames) "
+        f"FROM track_summaries {where} ORDER BY tracking_id",
+        params,
+    ).fetchall()
+
+
+def track_keypoints(conn, session, tracking_id, start_frame=None, end_frame=None):
+    """指定した人物・フレーム範囲のキーポイントをDataFrameで取得"""
+    query = "SELECT * FROM keypoints WHERE session_id = ? AND tracking_id = ?"
+    params = [session_id(conn, session), tracking_id]
+    if start_frame is not None:
+        query += " AND frame >= ?"
+        params.append(start_frame)
+    if end_frame is not None:
+        query += " AND frame < ?"
+        params.append(end_frame)
+    return pd.read_sql_query(query + " ORDER BY frame", conn, params=params)
+
+
+def main():
+    """メイン処理"""
+    args = parse_args()
+    conn = connect(args.db)
+
+    try:
+        if args.command == "import":
+            if not Path(args.csv).exists():
+                print(f"エラー: CSVファイル '{args.csv}' が見つかりません")
+                return
+            print(f"CSVファイルを取り込んでいます: {args.csv}")
+            import_csv(conn, args.csv, args.session, args.fps)
+            print(f"データベースに保存しました: {args.db}")
+
+        elif args.command == "sessions":
+            print(f"{'Session':<30} {'FPS':>6} {'IDs':>5}  Imported At")
+            for name, fps, imported_at, num_ids in list_sessions(conn):
+                print(f"{name:<30} {fps:>6.1f} {num_ids:>5}  {imported_at}")
+
+        elif args.command == "look-down":
+            print(f"{'Session':<30} {'Tracking ID':>11} {'Look Down (s)':>14} {'Observed (s)':>13}")
+            for name, tid, look_down_sec, observed_sec in look_down_totals(
+                    conn, args.session, args.start, args.end, args.min_seconds):
+                print(f"{name:<30} {tid:>11} {look_down_sec:>14.1f} {observed_sec:>13.1f}")
+
+        elif args.command == "summary":
+            print(f"{'Tracking ID':>11} {'First Frame':>12} {'Last Frame':>11} "
+                  f"{'Total Frames':>13} {'Look Down Frames':>17} {'Concentration Rate (%)':>23}")
+            for tid, first, last, total, look_down, rate in track_summaries(
+                    conn, args.session, args.tracking_id):
+                print(f"{tid:>11} {first:>12} {last:>11} {total:>13} {look_down:>17} {rate:>23.1f}")
+    except ValueError as e:
+        print(f"エラー: {e}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+トラッキングIDのステッチング（オフライン後処理）
+検出の途切れで分断されたtracking_idの断片を、時間と位置が整合するもの同士で
+1つのIDに統合し、IDの対応表（リマップテーブル）を出力します
+"""
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+
+# COCOキーポイントの定義
+COCO_KEYPOINTS = [
+    "nose",
+    "left-eye",
+    "right-eye",
+    "left-ear",
+    "right-ear",
+    "left-shoulder",
+    "right-shoulder",
+    "left-elbow",
+    "right-elbow",
+    "left-wrist",
+    "right-wrist",
+    "left-hip",
+    "right-hip",
+    "left-knee",
+    "right-knee",
+    "left-ankle",
+    "right-ankle",
+]
+
+
+def parse_args():
+    """コマンドライン引数のパース"""
+    parser = argparse.ArgumentParser(description="トラッキングIDの断片を統合")
+    parser.add_argument("-c", "--csv", type=str, default="pose_output.csv",
+                        help="入力CSVファイルのパス (デフォルト: pose_output.csv)")
+    parser.add_argument("-r", "--remap", type=str, default="id_remap.csv",
+                        help="IDリマップテーブルの出力先 (デフォルト: id_remap.csv)")
+    parser.add_argument("-o", "--output", type=str, default=None,
+                        help="IDを置き換えたCSVの出力先 (指定しない場合は出力しない)")
+    parser.add_argument("--max-gap", type=int, default=90,
+                        help="統合を許す断片間の最大フレーム差 (デフォルト: 90)")
+    parser.add_argument("--max-distance", type=float, default=None,
+                        help="統合を許す重心間の最大距離[px] (デフォルト: フレームの高さ/20)")
+    return parser.parse_args()
+
+
+def keypoint_centroids(df):
+    """各行の有効なキーポイントの重心を計算
+
+    <keypoint>_age の列があればそのフレームで観測された点のみを、
+    なければ座標0を未検出として除いた点を使う。
+    """
+    xs = df[[kp + "_x" for kp in COCO_KEYPOINTS]].to_numpy(dtype=float)
+    ys = df[[kp + "_y" for kp in COCO_KEYPOINTS]].to_numpy(dtype=float)
+    age_columns = [kp + "_age" for kp in COCO_KEYPOINTS]
+    if set(age_columns).issubset(df.columns):
+        valid = df[age_columns].to_numpy(dtype=float) == 0
+    else:
+        valid = (xs != 0) & (ys != 0) & ~np.isnan(xs) & ~np.isnan(ys)
+    counts = valid.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cx = np.where(valid, xs, 0.0).sum(axis=1) / counts
+        cy = np.where(valid, ys, 0.0).sum(axis=1) / counts
+    return np.column_stack([cx, cy])
+
+
+def build_fragments(df):
+    """tracking_idごとの開始・終了フレームと、その付近の重心をまとめる
+
+    開始・終了フレームは、観測が途切れた後にNorfairが推定値だけで書き出した行も含めた
+    トラックの全行から求める。重心は観測された点から計算できた最初・最後の行のものを使う。
+    """
+    df = df.dropna(subset=["tracking_id"]).copy()
+    df["tracking_id"] = df["tracking_id"].astype(int)
+    centroids = keypoint_centroids(df)
+    df["cx"] = centroids[:, 0]
+    df["cy"] = centroids[:, 1]
+
+    frames = df.groupby("tracking_id", sort=True)["frame"].agg(["min", "max"])
+
+    # 重心が計算できない行は端点の位置に使わない
+    df = df.dropna(subset=["cx", "cy"]).sort_values(["tracking_id", "frame"])
+    grouped = df.groupby("tracking_id", sort=True)
+    first = grouped.first()
+    last = grouped.last()
+    frames = frames.loc[first.index]
+
+    return pd.DataFrame({
+        "tracking_id": first.index.to_numpy(),
+        "start_frame": frames["min"].to_numpy(),
+        "start_x": first["cx"].to_numpy(),
+        "start_y": first["cy"].to_numpy(),
+        "end_frame": frames["max"].to_numpy(),
+        "end_x": last["cx"].to_numpy(),
+        "end_y": last["cy"].to_numpy(),
+    })
+
+
+def find_links(fragments, max_gap, max_distance):
+    """終了点と開始点をKD-treeで照合し、統合候補の組を求める
+
+    時間軸はmax_gapフレームがmax_distanceピクセルと等価になるようにスケールし、
+    (時間, x, y) の3次元空間で近傍探索を行う。
+    """
+    time_scale = max_distance / max_gap
+    starts = np.column_stack([
+        fragments["start_frame"].to_numpy() * time_scale,
+        fragments["start_x"].to_numpy(),
+        fragments["start_y"].to_numpy(),
+    ])
+    ends = np.column_stack([
+        fragments["end_frame"].to_numpy() * time_scale,
+        fragments["end_x"].to_numpy(),
+        fragments["end_y"].to_numpy(),
+    ])
+
+    # 時間・空間ともに上限いっぱいの候補も含まれる半径で検索
+    tree = cKDTree(starts)
+    neighbors = tree.query_ball_point(ends, r=np.sqrt(2) * max_distance)
+
+    src = np.repeat(np.arange(len(neighbors)), [len(n) for n in neighbors])
+    dst = np.fromiter((j for n in neighbors for j in n), dtype=np.int64, count=len(src))
+
+    start_frames = fragments["start_frame"].to_numpy()
+    end_frames = fragments["end_frame"].to_numpy()
+    gap = start_frames[dst] - end_frames[src]
+    dist = np.hypot(starts[dst, 1] - ends[src, 1], starts[dst, 2] - ends[src, 2])
+
+    # 終了後に始まり、時間・距離とも閾値以内の組のみ残す
+    ok = (gap > 0) & (gap <= max_gap) & (dist <= max_distance)
+    src, dst, gap, dist = src[ok], dst[ok], gap[ok], dist[ok]
+    cost = dist / max_distance + gap / max_gap
+    return src, dst, cost
+
+
+def stitch_fragments(fragments, max_gap, max_distance):
+    """コストの小さい組から貪欲に連結し、断片ID -> 統合IDの対応を返す"""
+    n = len(fragments)
+    ids = fragments["tracking_id"].to_numpy()
+    if n == 0:
+        return {}
+
+    src, dst, cost = find_links(fragments, max_gap, max_distance)
+    order = np.argsort(cost, kind="stable")
+
+    # 各断片は前後それぞれ高々1つの断片とだけ連結する
+    next_of = np.full(n, -1, dtype=np.int64)
+    has_prev = np.zeros(n, dtype=bool)
+    for s, d in zip(src[order], dst[order]):
+        if next_of[s] == -1 and not has_prev[d]:
+            next_of[s] = d
+            has_prev[d] = True
+
+    # 連結の先頭から辿り、先頭のIDを統合IDとする
+    remap = {}
+    for head in np.flatnonzero(~has_prev):
+        node = head
+        while node != -1:
+            remap[int(ids[node])] = int(ids[head])
+            node = next_of[node]
+    return remap
+
+
+def main():
+    """メイン処理"""
+    args = parse_args()
+
+    # CSVファイルの存在確認
+    if not Path(args.csv).exists():
+        print(f"エラー: CSVファイル '{args.csv}' が見つかりません")
+        return
+
+    print(f"CSVファイルを読み込んでいます: {args.csv}")
+    df = pd.read_csv(args.csv)
+
+    fragments = build_fragments(df)
+    if len(fragments) == 0:
+        print("エラー: CSVファイルにトラッキングされた人物のデータがありません")
+        return
+    print(f"断片数: {len(fragments)}")
+
+    max_distance = args.max_distance
+    if max_distance is None:
+        max_distance = df["frame_height"].dropna().iloc[0] / 20
+
+    remap = stitch_fragments(fragments, args.max_gap, max_distance)
+    remap_df = pd.DataFrame(sorted(remap.items()), columns=["tracking_id", "stitched_id"])
+    remap_df.to_csv(args.remap, index=False)
+
+    print(f"統合後のID数: {remap_df['stitched_id'].nunique()}")
+    print(f"IDリマップテーブルを保存しました: {args.remap}")
+
+    if args.output:
+        df["tracking_id"] = df["tracking_id"].map(remap).fillna(df["tracking_id"])
+        df.to_csv(args.output, index=False)
+        print(f"IDを置き換えたCSVを保存しました: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+トラッキング結果のCSV出力
+人物ごとの行を書き出すCSVと、フレームごとの検出数だけを記録するフレームインデックスの
+2つを出力します。人物がいないフレームはフレームインデックスにのみ記録されます
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+from head_pose_features import tracked_object_scores
+
+
+# COCOキーポイントの定義
+COCO_KEYPOINTS = [
+    "nose",
+    "left-eye",
+    "right-eye",
+    "left-ear",
+    "right-ear",
+    "left-shoulder",
+    "right-shoulder",
+    "left-elbow",
+    "right-elbow",
+    "left-wrist",
+    "right-wrist",
+    "left-hip",
+    "right-hip",
+    "left-knee",
+    "right-knee",
+    "left-ankle",
+    "right-ankle",
+]
+
+FRAME_INDEX_FIELDS = ["frame", "detections", "tracked_objects"]
+
+
+def create_csv_header():
+    """CSV出力用のヘッダーを作成"""
+    fieldnames_list = ["frame"]
+    fieldnames_list += [keypoints + coords for keypoints in COCO_KEYPOINTS
+                        for coords in ["_x", "_y"]]
+    fieldnames_list += [keypoints + "_conf" for keypoints in COCO_KEYPOINTS]
+    fieldnames_list += [keypoints + "_age" for keypoints in COCO_KEYPOINTS]
+    fieldnames_list += ["frame_height", "frame_width", "tracking_id",
+                        "dist_ear_nose", "head_pitch", "look_down"]
+    return fieldnames_list
+
+
+def frame_index_path(csv_path):
+    """CSVのパスからフレームインデックスの既定のパスを作成 (pose_output.csv -> pose_output_frames.csv)"""
+    path = Path(csv_path)
+    return str(path.with_name(path.stem + "_frames" + path.suffix))
+
+
+def write_frame_index(writer, frame_num, num_detections, num_tracked):
+    """フレームごとの検出数とトラッキング対象数をフレームインデックスに書き込み"""
+    writer.writerow({
+        "frame": frame_num,
+        "detections": num_detections,
+        "tracked_objects": num_tracked,
+    })
+
+
+def write_tracked_object(writer, frame_num, video_h, video_w, obj, conf, age,
+                         dist_ear_nose, head_pitch, look_down):
+    """トラッキングされたオブジェクトの情報をCSVに書き込み"""
+    csv_dict = {"frame": frame_num}
+    for field, coords in zip(COCO_KEYPOINTS, obj.estimate):
+        csv_dict[field + "_x"] = coords[0]
+        csv_dict[field + "_y"] = coords[1]
+    for field, c, a in zip(COCO_KEYPOINTS, conf, age):
+        csv_dict[field + "_conf"] = round(float(c), 3)
+        # 一度も観測されていないキーポイントは空欄
+        csv_dict[field + "_age"] = None if np.isnan(a) else int(a)
+    csv_dict["frame_height"] = video_h
+    csv_dict["frame_width"] = video_w
+    csv_dict["tracking_id"] = obj.id
+    csv_dict["dist_ear_nose"] = dist_ear_nose
+    csv_dict["head_pitch"] = head_pitch
+    csv_dict["look_down"] = look_down
+
+    writer.writerow(csv_dict)
+
+
+class KeypointObservations:
+    """トラックごとに、各キーポイントを最後に観測したフレームを記録する
+
+    Norfairの推定値は、検出されなかったキーポイントでも過去の値から作られるため、
+    その時点の信頼度（conf）と最後に観測されてからのフレーム数（age）を併せて出力する。
+    """
+
+    def __init__(self, detection_threshold):
+        self.detection_threshold = detection_threshold
+        self._last_seen = {}
+
+    def update(self, frame_num, tracked_objects, detections):
+        """1フレーム分の信頼度 (N, 17) と最終観測からのフレーム数 (N, 17) を返す
+
+        信頼度はtracked_object_scoresの値（うつむき判定に使う値と同じ）で、
+        このフレームの検出と対応付けられなかったオブジェクトでは0。
+        一度も観測されていないキーポイントのフレーム数はNaN。
+        """
+        matched = {id(detection) for detection in detections}
+        last_seen = {}
+        for obj in tracked_objects:
+            seen = self._last_seen.get(obj.id)
+            if seen is None:
+                seen = np.full(len(COCO_KEYPOINTS), np.nan)
+            if id(obj.last_detection) in matched:
+                scores = np.asarray(obj.last_detection.scores, dtype=float)
+                seen = np.where(scores > self.detection_threshold, frame_num, seen)
+            last_seen[obj.id] = seen
+
+        # 現在のフレームにいないトラックは破棄
+        self._last_seen = last_seen
+        ages = np.array([frame_num - last_seen[obj.id] for obj in tracked_objects])
+        confs = tracked_object_scores(tracked_objects, detections)
+        return confs, ages.reshape(len(tracked_objects), len(COCO_KEYPOINTS))
@@ -44,6 +44,8 @@ def parse_args():
                         help="プロットするキーポイント (デフォルト: nose)")
     parser.add_argument("-o", "--output", type=str, default=None,
                         help="プロット画像の保存先 (指定しない場合は画面表示)")
+    parser.add_argument("-r", "--remap", type=str, default=None,
+                        help="track_stitching.pyで作成したIDリマップテーブルのパス")
     parser.add_argument("--list-ids", action="store_true",
                         help="利用可能なtracking IDのリストを表示して終了")
     return parser.parse_args()
@@ -162,7 +164,12 @@ def main():
 
     # CSVファイルの読み込み
     print(f"CSVファイルを読み込んでいます: {args.csv}")
-    df = pd.read_csv(args.csv).dropna(how="any")
+    df = pd.read_csv(args.csv).dropna(subset=["tracking_id"])
+
+    # 統合IDへの置き換え
+    if args.remap:
+        remap = pd.read_csv(args.remap).set_index("tracking_id")["stitched_id"]
+        df["tracking_id"] = df["tracking_id"].map(remap).fillna(df["tracking_id"])
 
     if df.empty:
         print("エラー: CSVファイルにデータがありません")